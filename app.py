@@ -1,12 +1,31 @@
-from flask import Flask, jsonify, render_template_string, request
-from model import predict_tenant, train_model
-import pandas as pd
+import time
+
+_startup_started = time.perf_counter()
+
+from flask import Flask, Response, g, jsonify, render_template_string, request, stream_with_context, url_for
 from werkzeug.utils import secure_filename
+import json
 import os
+import sys
+import uuid
+
+import metrics
+from metrics import stage
+
+# numpy, pandas, sklearn and the model are imported inside the routes that
+# need them, so the server (and the home page / 404 handler) starts without them
 
 app = Flask(__name__)
 app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 app.config['UPLOAD_FOLDER'] = 'uploads'
+# Used by /train when nothing is uploaded; a file, directory or glob
+app.config['TRAIN_DATA'] = os.environ.get('TENANT_TRAIN_DATA', 'data/Credit_Income_Check.csv')
+app.config['STREAM_MAX_CONTENT_LENGTH'] = None  # no limit for /score-stream
+app.config['PROFILER_ENABLED'] = os.environ.get('TENANT_PROFILER') == '1'
+# Score concurrent single-row predictions together (threaded servers only)
+app.config['MICROBATCH_ENABLED'] = os.environ.get('TENANT_MICROBATCH') == '1'
+app.config['MICROBATCH_MAX_SIZE'] = int(os.environ.get('MICROBATCH_MAX_SIZE', '64'))
+app.config['MICROBATCH_WAIT_MS'] = float(os.environ.get('MICROBATCH_WAIT_MS', '2'))
 
 # Ensure upload folder exists
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
@@ -45,9 +64,9 @@ HTML_TEMPLATE = """
                 <div class="card-body">
                     <form action="/train" method="post" enctype="multipart/form-data">
                         <div class="mb-3">
-                            <label for="file" class="form-label">Upload Training CSV File (optional)</label>
-                            <input type="file" class="form-control" id="file" name="file" accept=".csv">
-                            <div class="form-text">If no file is provided, default dataset will be used.</div>
+                            <label for="file" class="form-label">Upload Training CSV Files (optional)</label>
+                            <input type="file" class="form-control" id="file" name="file" accept=".csv" multiple>
+                            <div class="form-text">Select one or more files. If no file is provided, default dataset will be used.</div>
                         </div>
                         <button type="submit" class="btn btn-primary">Train Model</button>
                     </form>
@@ -248,6 +267,30 @@ HTML_TEMPLATE = """
 
 
 
+@app.before_request
+def _start_timer():
+    g.request_started = time.perf_counter()
+    g.route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+    metrics.current_route.set(g.route)
+
+
+@app.after_request
+def _record_request(response):
+    started = g.get('request_started')
+    if started is not None:
+        labels = {'route': g.route, 'method': request.method, 'status': response.status_code}
+        metrics.request_seconds.observe(time.perf_counter() - started, **labels)
+        metrics.requests_total.inc(**labels)
+        if response.status_code >= 500:
+            metrics.request_errors_total.inc(route=g.route)
+    return response
+
+
+def _error_response(e):
+    app.logger.exception("Request to %s failed", request.path)
+    return jsonify({'error': str(e)}), 500
+
+
 @app.route('/')
 def home():
     return render_template_string(HTML_TEMPLATE)
@@ -262,7 +305,10 @@ def test():
         return render_template_string(HTML_TEMPLATE)
         
     try:
-        data = request.get_json()
+        from model import predict_tenant
+
+        with stage('json_decode'):
+            data = request.get_json()
         result = predict_tenant([
             data['MonthlyIncome'],
             data['FICOScore'],
@@ -272,27 +318,55 @@ def test():
             data['AssetMonthlyValue']
         ])
         
-        return jsonify(result)
+        with stage('serialization'):
+            return jsonify(result)
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _error_response(e)
+
 
 
 
 
 
+def _matrix_response():
+    # Binary path for /predict and /predict-batch: the body is decoded into
+    # an array view without copying and the whole matrix is scored at once
+    # (see codec.py for the format)
+    import numpy as np
+    from codec import MATRIX_MIMETYPE, SHAPE_HEADER, UnsupportedEncoding, decode_matrix, encode_matrix
+    from model import FEATURE_COLUMNS, predict_batch
+
+    encoding = request.headers.get('Content-Encoding')
+    try:
+        with stage('matrix_decode'):
+            X = decode_matrix(request.get_data(cache=False), len(FEATURE_COLUMNS), encoding)
+        predictions, confidences = predict_batch(X)
+        with stage('serialization'):
+            body, shape = encode_matrix(np.column_stack((predictions, confidences)), encoding)
+    except UnsupportedEncoding as e:
+        return jsonify({'error': str(e)}), 415
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    response = Response(body, mimetype=MATRIX_MIMETYPE)
+    response.headers[SHAPE_HEADER] = shape
+    if encoding and encoding.strip().lower() != 'identity':
+        response.headers['Content-Encoding'] = encoding.strip().lower()
+    return response
+
 
 @app.route('/predict', methods=['POST'])
 def predict():
     try:
-        data = request.get_json()
-        required_fields = [
-            'MonthlyIncome',
-            'FICOScore',
-            'RentToIncomeRatio',
-            'HasCriminalRecord',
-            'HasEvictionHistory',
-            'AssetMonthlyValue'
-        ]
+        from codec import MATRIX_MIMETYPE
+        from model import FEATURE_COLUMNS, predict_tenant
+
+        if request.mimetype == MATRIX_MIMETYPE:
+            return _matrix_response()
+
+        with stage('json_decode'):
+            data = request.get_json()
+        required_fields = FEATURE_COLUMNS
         
         # Validate input
         if not all(field in data for field in required_fields):
@@ -310,55 +384,256 @@ def predict():
         
         # Get prediction
         result = predict_tenant(tenant_data)
-        return jsonify(result)
+        with stage('serialization'):
+            return jsonify(result)
         
     except Exception as e:
-        return jsonify({'error': str(e)}), 500
+        return _error_response(e)
 
 
+def _batch_response(X):
+    from model import predict_batch
 
+    predictions, confidences = predict_batch(X)
+    with stage('serialization'):
+        return jsonify({
+            'predictions': [
+                {'prediction': int(p), 'confidence': float(c)}
+                for p, c in zip(predictions.tolist(), confidences.tolist())
+            ]
+        })
 
 
+@app.route('/predict-batch', methods=['POST'])
+def predict_many():
+    try:
+        import numpy as np
+        from codec import MATRIX_MIMETYPE
+        from model import FEATURE_COLUMNS
+
+        if request.mimetype == MATRIX_MIMETYPE:
+            return _matrix_response()
+
+        with stage('json_decode'):
+            data = request.get_json()
+        if not isinstance(data, list):
+            return jsonify({'error': 'Expected a JSON array of applicants'}), 400
 
+        # Validate input
+        if not all(isinstance(row, dict) and all(field in row for field in FEATURE_COLUMNS) for row in data):
+            return jsonify({'error': 'Missing required fields'}), 400
+
+        # Build the feature matrix in one go
+        X = np.array([[row[field] for field in FEATURE_COLUMNS] for row in data], dtype=np.float64)
+        X = X.reshape(-1, len(FEATURE_COLUMNS))
+        return _batch_response(X)
+
+    except Exception as e:
+        return _error_response(e)
+
+
+@app.route('/explain', methods=['POST'])
+def explain():
+    # Per-feature contributions to each decision. Accepts one applicant
+    # (JSON object), a JSON array of applicants or an uploaded CSV file
+    try:
+        import numpy as np
+        import pandas as pd
+        from model import FEATURE_COLUMNS, explain_batch
+
+        file = request.files.get('file')
+        if file is not None and file.filename:
+            single = False
+            with stage('csv_decode'):
+                X = pd.read_csv(file, usecols=FEATURE_COLUMNS)[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        else:
+            with stage('json_decode'):
+                data = request.get_json(silent=True)
+            single = isinstance(data, dict)
+            rows = [data] if single else data
+            if not isinstance(rows, list) or not all(
+                isinstance(row, dict) and all(field in row for field in FEATURE_COLUMNS) for row in rows
+            ):
+                return jsonify({'error': 'Missing required fields'}), 400
+            X = np.array([[row[field] for field in FEATURE_COLUMNS] for row in rows], dtype=np.float64)
+            X = X.reshape(-1, len(FEATURE_COLUMNS))
+
+        predictions, confidences, bias, contributions = explain_batch(X)
+        with stage('serialization'):
+            explanations = [
+                {
+                    'prediction': p,
+                    'confidence': c,
+                    'bias': b,
+                    'contributions': dict(zip(FEATURE_COLUMNS, row))
+                }
+                for p, c, b, row in zip(predictions.tolist(), confidences.tolist(), bias.tolist(), contributions.tolist())
+            ]
+            return jsonify(explanations[0] if single else {'explanations': explanations})
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return _error_response(e)
+
+
+@app.route('/test-batch', methods=['POST'])
+def test_batch():
+    try:
+        import numpy as np
+        import pandas as pd
+        from model import FEATURE_COLUMNS
+
+        file = request.files.get('file')
+        if file is None or not file.filename:
+            return jsonify({'error': 'No CSV file provided'}), 400
+
+        # Read only the feature columns straight into a float matrix
+        with stage('csv_decode'):
+            df = pd.read_csv(file, usecols=FEATURE_COLUMNS)
+            X = df[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+        return _batch_response(X)
+
+    except Exception as e:
+        return _error_response(e)
+
+
+@app.route('/score-stream', methods=['POST'])
+def score_csv_stream():
+    # Scores a raw CSV request body (Content-Type: text/csv) chunk by chunk and
+    # streams the results back while the upload is still being read
+    from itertools import chain
+    from model import registry
+    from scoring import DEFAULT_CHUNKSIZE, FORMATS, iter_feature_chunks, score_chunks
+
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in FORMATS:
+        return jsonify({'error': f"Unsupported format '{fmt}'"}), 400
+    try:
+        chunksize = int(request.args.get('chunksize', DEFAULT_CHUNKSIZE))
+    except ValueError:
+        return jsonify({'error': 'chunksize must be an integer'}), 400
+    if chunksize <= 0:
+        return jsonify({'error': 'chunksize must be positive'}), 400
+
+    # Lift the upload size cap for this view only; the body is never held in memory
+    limit = app.config['STREAM_MAX_CONTENT_LENGTH']
+    request.max_content_length = sys.maxsize if limit is None else limit
+
+    # Once the headers are sent an error can only cut the body short, so load
+    # the model (500 if there is none) and read the first chunk, which checks
+    # the columns (400), before responding
+    try:
+        registry.get()
+        chunks = iter_feature_chunks(request.stream, chunksize)
+        first = next(chunks, None)
+    except ValueError as e:
+        return jsonify({'error': f"Invalid CSV body: {e}"}), 400
+    except Exception as e:
+        return _error_response(e)
+    if first is not None:
+        chunks = chain([first], chunks)
+
+    mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+    return Response(
+        stream_with_context(score_chunks(chunks, fmt)),
+        mimetype=mimetype
+    )
+
+
+
+
+
+
+
+
+def _training_options(form):
+    # Optional form fields: estimator, n_jobs, params / param_grid (JSON), cv,
+    # tree-size limits, artifact options, and mode=incremental with
+    # extra_estimators to grow the current forest
+    options = {}
+    if form.get('mode') == 'incremental':
+        options['mode'] = 'incremental'
+    if form.get('extra_estimators'):
+        options['extra_estimators'] = int(form['extra_estimators'])
+    if form.get('estimator'):
+        options['estimator'] = form['estimator']
+    if form.get('n_jobs'):
+        options['n_jobs'] = int(form['n_jobs'])
+    if form.get('params'):
+        options['params'] = json.loads(form['params'])
+    if form.get('param_grid'):
+        options['param_grid'] = json.loads(form['param_grid'])
+    if form.get('cv'):
+        options['cv'] = int(form['cv'])
+    # Tree-size limits, merged into params
+    for name in ('max_depth', 'min_samples_leaf', 'max_leaf_nodes'):
+        if form.get(name):
+            options.setdefault('params', {})[name] = int(form[name])
+    if form.get('ccp_alpha'):
+        options.setdefault('params', {})['ccp_alpha'] = float(form['ccp_alpha'])
+    # Artifact options: joblib compression level, compiled forest quantization
+    if form.get('compress'):
+        options['compress'] = int(form['compress'])
+    if form.get('quantize'):
+        options['quantize'] = form['quantize']
+    if form.get('prune_depth'):
+        options['prune_depth'] = int(form['prune_depth'])
+    return options
 
 
 @app.route('/train', methods=['GET', 'POST'])
 def train():
     try:
-        if request.method == 'POST' and 'file' in request.files:
-            file = request.files['file']
-            if file.filename:
-                filename = secure_filename(file.filename)
-                filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-                file.save(filepath)
-                data_path = filepath
-            else:
-                data_path = 'data/Credit_Income_Check.csv'
-        else:
-            data_path = 'data/Credit_Income_Check.csv'
+        from jobs import training_jobs
+
+        options = _training_options(request.form)
+
+        # Several files (e.g. monthly exports) train one model together
+        uploaded = []
+        if request.method == 'POST':
+            for file in request.files.getlist('file'):
+                if file.filename:
+                    # Prefix uploads so concurrent jobs never share a file
+                    filename = f"{uuid.uuid4().hex}_{secure_filename(file.filename)}"
+                    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+                    file.save(filepath)
+                    uploaded.append(filepath)
+        data_path = uploaded if uploaded else app.config['TRAIN_DATA']
             
-        # Parse data from the file
-        from src.parse import parse_data
-        training_data = parse_data(data_path)
+        # Queue the training run and return straight away
+        try:
+            job, created = training_jobs.submit(data_path, options)
+        except Exception:
+            for filepath in uploaded:
+                os.remove(filepath)
+            raise
+        if not created:
+            # Identical to a pending job's uploads, so these copies are not needed
+            for filepath in uploaded:
+                os.remove(filepath)
+        response = {
+            'job_id': job['id'],
+            'status': job['status'],
+            'deduplicated': not created,
+            'status_url': url_for('train_status', job_id=job['id'])
+        }
         
-        if not training_data:
-            return render_template_string(
-                HTML_TEMPLATE,
-                error="Training Error",
-                message="No data could be parsed from file."
-            )
-            
-        # Train model with parsed data
-        accuracy = train_model(training_data)
-        success_message = f"Model trained successfully! Accuracy: {accuracy:.2%} using {len(training_data)} samples."
-        print(success_message)
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify(response), 202
         
         return render_template_string(
             HTML_TEMPLATE,
             error=None,
-            message=success_message
-        )
+            message=f"Training job {job['id']} is {job['status']}. Poll {response['status_url']} for progress."
+        ), 202
         
+    except ValueError as e:
+        # Invalid options (bad JSON or numbers, or fields an incremental run
+        # does not take)
+        if request.accept_mimetypes.best == 'application/json':
+            return jsonify({'error': str(e)}), 400
+        return render_template_string(HTML_TEMPLATE, error="Training Error", message=str(e)), 400
     except Exception as e:
         return render_template_string(
             HTML_TEMPLATE,
@@ -367,6 +642,23 @@ def train():
         )
 
 
+@app.route('/train/jobs', methods=['GET'])
+def train_jobs():
+    from jobs import training_jobs
+
+    return jsonify({'jobs': training_jobs.list()})
+
+
+@app.route('/train/<job_id>', methods=['GET'])
+def train_status(job_id):
+    from jobs import training_jobs
+
+    job = training_jobs.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Unknown training job'}), 404
+    return jsonify(job)
+
+
 
 
 
@@ -385,6 +677,140 @@ def page_not_found(e):
 
 
 
+@app.route('/health', methods=['GET'])
+def health():
+    return jsonify({
+        'startup': app.config['STARTUP'],
+        'model_loaded': 'model' in sys.modules and sys.modules['model'].registry.loaded,
+        'microbatch': sys.modules['model'].microbatch_stats() if 'model' in sys.modules else None
+    })
+
+
+@app.route('/cache/stats', methods=['GET'])
+def cache_stats():
+    from cache import prediction_cache
+
+    return jsonify(prediction_cache.stats())
+
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    from model import store
+
+    return jsonify({'current': store.current(), 'versions': store.list_versions()})
+
+
+@app.route('/models/<version>', methods=['GET'])
+def model_version(version):
+    from model import store
+
+    try:
+        return jsonify(store.metadata(version))
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+
+
+@app.route('/models/<version>/activate', methods=['POST'])
+def activate_model(version):
+    # Make a stored version live (e.g. roll back); requests already running
+    # finish on the version they started with
+    from model import registry
+
+    try:
+        state = registry.activate(version)
+    except KeyError as e:
+        return jsonify({'error': e.args[0]}), 404
+    except Exception as e:
+        return _error_response(e)
+    return jsonify({'current': state.version})
+
+
+@app.route('/drift', methods=['GET'])
+def drift_report():
+    # Live feature distributions and data quality against the training profile
+    from drift import drift_monitor
+
+    return jsonify(drift_monitor.report())
+
+
+@app.route('/drift/reset', methods=['POST'])
+def drift_reset():
+    # Start a fresh observation window
+    from drift import drift_monitor
+
+    drift_monitor.reset()
+    return jsonify(drift_monitor.report())
+
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    for key, value in app.config['STARTUP'].items():
+        if value is not None:
+            metrics.service_state.set(value, key=key)
+    if 'cache' in sys.modules:
+        for key, value in sys.modules['cache'].prediction_cache.stats().items():
+            if isinstance(value, (int, float)):
+                metrics.service_state.set(value, key=f"prediction_cache_{key}")
+    if 'drift' in sys.modules:
+        sys.modules['drift'].drift_monitor.report()  # refreshes the drift gauges
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+
+@app.route('/debug/profiler', methods=['GET'])
+def profiler_status():
+    if not app.config['PROFILER_ENABLED']:
+        return page_not_found(None)
+    from profiler import profiler
+
+    return jsonify(profiler.status())
+
+
+@app.route('/debug/profiler/start', methods=['POST'])
+def profiler_start():
+    # Switch on the sampling profiler in this process (TENANT_PROFILER=1 only)
+    if not app.config['PROFILER_ENABLED']:
+        return page_not_found(None)
+    from profiler import profiler
+
+    started = profiler.start(interval=float(request.args.get('interval', 0.005)))
+    return jsonify(dict(profiler.status(), started=started))
+
+
+@app.route('/debug/profiler/stop', methods=['POST'])
+def profiler_stop():
+    # Stop sampling and return the collected stacks in folded format
+    if not app.config['PROFILER_ENABLED']:
+        return page_not_found(None)
+    from profiler import profiler
+
+    return Response(profiler.stop(), mimetype='text/plain')
+
+
+def _preload_model():
+    # Load the model once in this process; under a pre-forking server
+    # (gunicorn --preload) this runs in the master, and with mmap_mode the
+    # workers share the artifact pages copy-on-write
+    from model import preload
+
+    start = time.perf_counter()
+    try:
+        preload(mmap_mode=os.environ.get('TENANT_MMAP_MODE', 'r') or None)
+    except FileNotFoundError as e:
+        print(f"Model not preloaded: {e}")
+    return time.perf_counter() - start
+
+
+app.config['STARTUP'] = {'preload_seconds': None}
+if os.environ.get('TENANT_PRELOAD_MODEL') == '1':
+    app.config['STARTUP']['preload_seconds'] = _preload_model()
+if app.config['MICROBATCH_ENABLED']:
+    from model import enable_microbatching
+
+    enable_microbatching(app.config['MICROBATCH_MAX_SIZE'], app.config['MICROBATCH_WAIT_MS'])
+app.config['STARTUP']['startup_seconds'] = time.perf_counter() - _startup_started
+print(f"App initialized in {app.config['STARTUP']['startup_seconds'] * 1000:.1f} ms")
+
+
 if __name__ == '__main__':
     print("Starting Flask server...")
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,297 @@
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+import numpy as np
+
+# Rows generated per write, so large synthetic files never sit in memory
+GENERATE_CHUNK_ROWS = 500_000
+
+def generate_csv(path, rows, seed=0):
+    # Synthetic applications with the raw columns parse_data expects
+    import pandas as pd
+
+    rng = np.random.default_rng(seed)
+    header = True
+    for start in range(0, rows, GENERATE_CHUNK_ROWS):
+        n = min(GENERATE_CHUNK_ROWS, rows - start)
+        income = rng.gamma(4.0, 1500.0, n).round(2)
+        fico = rng.normal(680, 60, n).round()
+        fico[rng.random(n) < 0.05] = np.nan
+        rent_ratio = rng.uniform(0.1, 0.6, n).round(3)
+        rent_ratio[rng.random(n) < 0.03] = np.nan
+        felonies = rng.poisson(0.1, n)
+        evictions = rng.poisson(0.08, n)
+        assets = rng.exponential(8000.0, n).round(2)
+
+        score = (
+            income / 5000
+            + (np.nan_to_num(fico, nan=680) - 650) / 50
+            - np.nan_to_num(rent_ratio, nan=0.3) * 3
+            - 2 * (felonies > 0)
+            - 2 * (evictions > 0)
+            + rng.normal(0, 0.5, n)
+        )
+        result = np.where(score > 0, 'PASSED', 'FAILED').astype(object)
+        result[rng.random(n) < 0.01] = None
+
+        pd.DataFrame({
+            'MonthlyIncome': income,
+            'FICOScore': fico,
+            'RentToIncomeRatio': rent_ratio,
+            'CriminalFederalCount': 0,
+            'CriminalFelonyCount': felonies,
+            'CriminalMisdemeanorCount': 0,
+            'Failed_Criminal': 0,
+            'EvictionCount': evictions,
+            'Failed_Eviction': 0,
+            'AssetMonthlyValue': assets,
+            'ApplicationResult': result
+        }).to_csv(path, mode='w' if header else 'a', header=header, index=False)
+        header = False
+    return path
+
+def _measure(func, *args, trace_memory=True, **kwargs):
+    # Run one stage, returning its result, wall time and traced peak memory
+    if trace_memory:
+        tracemalloc.start()
+    start = time.perf_counter()
+    try:
+        result = func(*args, **kwargs)
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] if trace_memory else None
+    finally:
+        if trace_memory:
+            tracemalloc.stop()
+    stats = {'seconds': seconds}
+    if peak is not None:
+        stats['peak_mb'] = peak / 2 ** 20
+    return result, stats
+
+def _latency_stats(samples):
+    samples = np.asarray(samples) * 1000
+    return {
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p99_ms': float(np.percentile(samples, 99)),
+        'mean_ms': float(samples.mean()),
+        'samples': len(samples)
+    }
+
+def _bench_concurrency(X, concurrency, requests_per_level, seed=0):
+    # /predict throughput and latency with `level` clients posting at once,
+    # scored inline and then micro-batched. Runs in-process through Flask
+    # test clients, so it measures the app and model, not the network
+    import model
+    from app import app
+    from src.parse import FEATURE_COLUMNS
+
+    rng = np.random.default_rng(seed)
+    payloads = [
+        dict(zip(FEATURE_COLUMNS, row))
+        for row in X[rng.integers(0, len(X), requests_per_level)].tolist()
+    ]
+
+    def run_level(level):
+        latencies = [[] for _ in range(level)]
+        errors = []
+        barrier = threading.Barrier(level + 1)
+
+        def client(i):
+            with app.test_client() as http:
+                barrier.wait()
+                for payload in payloads[i::level]:
+                    start = time.perf_counter()
+                    response = http.post('/predict', json=payload)
+                    latencies[i].append(time.perf_counter() - start)
+                    if response.status_code != 200:
+                        errors.append(response.status_code)
+
+        threads = [threading.Thread(target=client, args=(i,)) for i in range(level)]
+        for thread in threads:
+            thread.start()
+        barrier.wait()
+        start = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        seconds = time.perf_counter() - start
+
+        stats = _latency_stats([latency for client_latencies in latencies for latency in client_latencies])
+        stats.update({'concurrency': level, 'seconds': seconds, 'requests_per_second': len(payloads) / seconds,
+                      'errors': len(errors)})
+        return stats
+
+    results = {}
+    try:
+        for mode in ('inline', 'microbatch'):
+            if mode == 'microbatch':
+                batcher = model.enable_microbatching(
+                    app.config['MICROBATCH_MAX_SIZE'], app.config['MICROBATCH_WAIT_MS']
+                )
+            run_level(1)  # warm up
+            results[mode] = [run_level(level) for level in concurrency]
+            if mode == 'microbatch':
+                results[mode + '_stats'] = batcher.stats()
+    finally:
+        model.disable_microbatching()
+    return results
+
+# Artifact variants compared with the default (unbounded, full precision)
+ARTIFACT_VARIANTS = {
+    'compress_3': {'compress': 3},
+    'max_depth_12': {'params': {'max_depth': 12}},
+    'min_samples_leaf_5': {'params': {'min_samples_leaf': 5}},
+    'quantize_float32': {'quantize': 'float32'},
+    'quantize_uint16': {'quantize': 'uint16'},
+    'prune_depth_12': {'prune_depth': 12}
+}
+
+def bench_artifacts(data, variants=ARTIFACT_VARIANTS):
+    # Size on disk, size and load time of what serving reads, compiled
+    # forest size and accuracy change of each artifact option against the
+    # default model
+    import model
+
+    def summarize(report):
+        quantization = report.get('quantization')
+        return {
+            'accuracy': quantization['accuracy'] if quantization else report['accuracy'],
+            'total_bytes': report['artifacts']['total_bytes'],
+            'serving_bytes': report['artifacts']['serving_bytes'],
+            'sizes': report['artifacts']['sizes'],
+            'load_seconds': report['artifacts']['load_seconds'],
+            'compiled_bytes': quantization['bytes_after'] if quantization else model.registry.get().compiled.nbytes
+        }
+
+    baseline = summarize(model.train_model_report(data))
+    results = {'baseline': baseline}
+    for name, options in variants.items():
+        result = summarize(model.train_model_report(data, **options))
+        result['accuracy_delta'] = result['accuracy'] - baseline['accuracy']
+        result['size_ratio'] = result['serving_bytes'] / baseline['serving_bytes']
+        result['disk_ratio'] = result['total_bytes'] / baseline['total_bytes']
+        results[name] = result
+    return results
+
+def bench_size(rows, workdir, predict_samples=1000, batch_rows=None, trace_memory=True, seed=0,
+               concurrency=(), concurrent_requests=2000, artifacts=False):
+    import model
+    from cache import prediction_cache
+    from src.parse import FEATURE_COLUMNS, parse_data
+
+    result = {'rows': rows}
+    csv_path = os.path.join(workdir, f"applicants_{rows}.csv")
+
+    _, result['generate'] = _measure(generate_csv, csv_path, rows, seed, trace_memory=False)
+    result['csv_bytes'] = os.path.getsize(csv_path)
+
+    # Parsing, without and then with the columnar cache
+    cache_dir = os.path.join(workdir, 'parse_cache')
+    data, result['parse'] = _measure(parse_data, csv_path, cache_dir=None, trace_memory=trace_memory)
+    _, result['parse_cached_write'] = _measure(parse_data, csv_path, cache_dir=cache_dir, trace_memory=trace_memory)
+    _, result['parse_cached_read'] = _measure(parse_data, csv_path, cache_dir=cache_dir, trace_memory=trace_memory)
+
+    if artifacts:
+        result['artifacts'] = bench_artifacts(data)
+    report, result['train'] = _measure(model.train_model_report, data, trace_memory=trace_memory)
+    result['train']['accuracy'] = report['accuracy']
+
+    X = data[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    del data
+
+    # Single-row latency with the prediction cache out of the way
+    maxsize, prediction_cache.maxsize = prediction_cache.maxsize, 0
+    try:
+        model.predict_tenant(X[0].tolist())  # warm up
+        rows_to_score = X[np.random.default_rng(seed).integers(0, len(X), predict_samples)].tolist()
+        latencies = []
+        for row in rows_to_score:
+            start = time.perf_counter()
+            model.predict_tenant(row)
+            latencies.append(time.perf_counter() - start)
+        result['predict_single'] = _latency_stats(latencies)
+        if concurrency:
+            result['predict_concurrent'] = _bench_concurrency(X, concurrency, concurrent_requests, seed)
+    finally:
+        prediction_cache.maxsize = maxsize
+
+    X_batch = X if batch_rows is None else X[:batch_rows]
+    _, stats = _measure(model.predict_batch, X_batch, trace_memory=trace_memory)
+    stats['rows'] = len(X_batch)
+    stats['rows_per_second'] = len(X_batch) / stats['seconds']
+    result['predict_batch'] = stats
+    return result
+
+def run(sizes, workdir=None, output=None, **options):
+    import sklearn
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'sklearn': sklearn.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count()
+        },
+        'results': []
+    }
+
+    with tempfile.TemporaryDirectory(dir=workdir) as tmp:
+        # Artifacts are written relative to the working directory, so run in
+        # a scratch directory to keep the real model untouched
+        cwd = os.getcwd()
+        os.chdir(tmp)
+        try:
+            for rows in sizes:
+                print(f"Benchmarking {rows} rows...", file=sys.stderr)
+                report['results'].append(bench_size(rows, tmp, **options))
+        finally:
+            os.chdir(cwd)
+
+    report['meta']['max_rss_mb'] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    text = json.dumps(report, indent=2)
+    if output:
+        with open(output, 'w') as f:
+            f.write(text + '\n')
+    return report, text
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark parsing, training and prediction on synthetic data.")
+    parser.add_argument('--rows', type=int, nargs='+', default=[10_000, 100_000], help="dataset sizes to run")
+    parser.add_argument('--predict-samples', type=int, default=1000, help="single-row predictions to time")
+    parser.add_argument('--batch-rows', type=int, default=None, help="rows per batch prediction (default: all)")
+    parser.add_argument('--concurrency', type=int, nargs='*', default=[1, 8, 32, 128],
+                        help="concurrent /predict clients to time, inline and micro-batched (none to skip)")
+    parser.add_argument('--concurrent-requests', type=int, default=2000, help="requests sent per concurrency level")
+    parser.add_argument('--artifacts', action='store_true',
+                        help="compare artifact options (compression, tree limits, quantization)")
+    parser.add_argument('--no-memory', action='store_true', help="skip tracemalloc peak-memory tracking")
+    parser.add_argument('--workdir', default=None, help="directory for the temporary files")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('-o', '--output', default=None, help="write the JSON report here")
+    args = parser.parse_args(argv)
+
+    _, text = run(
+        args.rows,
+        workdir=args.workdir,
+        output=args.output,
+        predict_samples=args.predict_samples,
+        batch_rows=args.batch_rows,
+        concurrency=args.concurrency,
+        concurrent_requests=args.concurrent_requests,
+        artifacts=args.artifacts,
+        trace_memory=not args.no_memory,
+        seed=args.seed
+    )
+    if not args.output:
+        print(text)
+
+if __name__ == "__main__":
+    main()
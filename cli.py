@@ -0,0 +1,273 @@
+import argparse
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import json
+import math
+import os
+import sys
+import time
+
+# Offline entry point for batch jobs: train, score and evaluate without the
+# Flask server.
+#
+#   python cli.py train data/2024-*.csv --estimator extra_trees
+#   python cli.py score applicants.csv -o scores.ndjson --workers 4
+#   python cli.py evaluate labelled.csv --min-accuracy 0.85
+#
+# Results go to stdout (or --output); one line of JSON with the timings and
+# outcome goes to stderr. Exit codes:
+EXIT_OK = 0
+EXIT_FAILURE = 1          # unexpected error
+EXIT_USAGE = 2            # bad arguments (argparse)
+EXIT_NO_MODEL = 3         # nothing has been trained yet
+EXIT_BAD_INPUT = 4        # input missing or unreadable, or invalid options
+EXIT_BELOW_THRESHOLD = 5  # evaluate: accuracy under --min-accuracy
+
+
+class CommandError(Exception):
+    def __init__(self, message, exit_code):
+        super().__init__(message)
+        self.exit_code = exit_code
+
+
+def _load_model():
+    # Load the live version once and keep it for the whole run, so a version
+    # published meanwhile does not change results halfway through a file
+    from model import preload, registry
+
+    try:
+        state = preload(mmap_mode='r')
+    except FileNotFoundError as e:
+        raise CommandError(str(e), EXIT_NO_MODEL) from None
+    registry.check_interval = math.inf
+    return state
+
+
+@contextmanager
+def _output(path):
+    if path == '-':
+        yield sys.stdout
+        sys.stdout.flush()
+        return
+    with open(path, 'w', newline='') as f:
+        yield f
+
+
+# Flags that only apply to a full training run; an incremental run keeps
+# the settings of the current model
+FULL_TRAINING_FLAGS = ('estimator', 'params', 'compress', 'quantize', 'prune_depth')
+
+
+def _flag(name):
+    return '--' + name.replace('_', '-')
+
+
+def cmd_train(args, timings):
+    from src.parse import cache_entries, parse_cached, resolve_paths
+
+    # Unset flags are None, so a flag given to the wrong mode is rejected
+    # rather than silently ignored
+    given = [name for name in FULL_TRAINING_FLAGS if getattr(args, name) is not None]
+    if args.incremental and given:
+        raise CommandError(
+            f"{', '.join(map(_flag, given))} cannot be used with --incremental; "
+            "it keeps the settings of the current model",
+            EXIT_BAD_INPUT
+        )
+    if not args.incremental and args.extra_estimators is not None:
+        raise CommandError("--extra-estimators only applies with --incremental", EXIT_BAD_INPUT)
+
+    options = {'n_jobs': args.n_jobs}
+    if args.incremental:
+        from model import train_incremental_report as train
+
+        _load_model()  # the forest to grow
+        if args.extra_estimators is not None:
+            options['extra_estimators'] = args.extra_estimators
+    else:
+        from model import train_model_report as train
+
+        options.update({name: getattr(args, name) for name in given})
+        if 'params' in options:
+            options['params'] = json.loads(args.params) if args.params else None
+
+    start = time.perf_counter()
+    sources = cache_entries(resolve_paths(args.data), max_workers=args.workers)
+    data = parse_cached(sources)
+    timings['parse_seconds'] = time.perf_counter() - start
+    if len(data) == 0:
+        raise ValueError("No data could be parsed from the input.")
+
+    start = time.perf_counter()
+    report = train(data, sources=sources, **options)
+    timings['train_seconds'] = time.perf_counter() - start
+    timings.update({
+        'rows': report['samples'],
+        'mode': report['mode'],
+        'accuracy': report['accuracy'],
+        'model_version': report.get('version')
+    })
+
+    with _output(args.output) as out:
+        json.dump(report, out, indent=2, default=str)
+        out.write('\n')
+
+
+def _init_score_worker():
+    _load_model()
+
+
+def _score_chunk(X, start, fmt):
+    from model import predict_batch
+    from scoring import format_chunk
+
+    predictions, confidences = predict_batch(X)
+    return format_chunk(predictions, confidences, start, fmt)
+
+
+def cmd_score(args, timings):
+    from scoring import iter_feature_chunks
+
+    state = _load_model()
+    timings['model_version'] = state.version
+    source = sys.stdin if args.input == '-' else args.input
+    if source is not sys.stdin and not os.path.isfile(source):
+        raise FileNotFoundError(f"No such file: '{source}'")
+
+    rows = 0
+    start = time.perf_counter()
+    with _output(args.output) as out:
+        if args.format == 'csv':
+            out.write('row,prediction,confidence\n')
+        if args.workers <= 1:
+            for X in iter_feature_chunks(source, args.chunksize):
+                out.write(_score_chunk(X, rows, args.format))
+                rows += len(X)
+        else:
+            # Chunks are read here and scored by a pool of processes, each
+            # holding the model memory-mapped; results are written in input
+            # order with a bounded number of chunks in flight
+            pending = deque()
+            with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_score_worker) as pool:
+                for X in iter_feature_chunks(source, args.chunksize):
+                    pending.append(pool.submit(_score_chunk, X, rows, args.format))
+                    rows += len(X)
+                    if len(pending) >= 2 * args.workers:
+                        out.write(pending.popleft().result())
+                while pending:
+                    out.write(pending.popleft().result())
+    seconds = time.perf_counter() - start
+    timings.update({
+        'rows': rows,
+        'score_seconds': seconds,
+        'rows_per_second': rows / seconds if rows and seconds else None,
+        'workers': args.workers
+    })
+
+
+def cmd_evaluate(args, timings):
+    import numpy as np
+    from model import FEATURE_COLUMNS, model_classes, predict_batch
+    from src.parse import LABEL_COLUMN, parse_many
+
+    state = _load_model()
+    timings['model_version'] = state.version
+
+    start = time.perf_counter()
+    data = parse_many(args.data, max_workers=args.workers)
+    timings['parse_seconds'] = time.perf_counter() - start
+    if len(data) == 0:
+        raise ValueError("No data could be parsed from the input.")
+
+    start = time.perf_counter()
+    predictions, confidences = predict_batch(data[FEATURE_COLUMNS].to_numpy(dtype=np.float64))
+    timings['score_seconds'] = time.perf_counter() - start
+    labels = data[LABEL_COLUMN].to_numpy()
+
+    accuracy = float(np.mean(predictions == labels))
+    classes = model_classes(state).tolist()
+    report = {
+        'model_version': state.version,
+        'rows': len(labels),
+        'accuracy': accuracy,
+        'positive_rate': float(np.mean(predictions == 1)),
+        'label_positive_rate': float(np.mean(labels == 1)),
+        'mean_confidence': float(confidences.mean()),
+        'classes': classes,
+        # confusion[i][j]: rows labelled classes[i] predicted as classes[j]
+        'confusion': [[int(np.sum((labels == a) & (predictions == b))) for b in classes] for a in classes]
+    }
+    timings.update({'rows': report['rows'], 'accuracy': accuracy})
+
+    with _output(args.output) as out:
+        json.dump(report, out, indent=2)
+        out.write('\n')
+
+    if args.min_accuracy is not None and accuracy < args.min_accuracy:
+        raise CommandError(f"Accuracy {accuracy:.4f} is below {args.min_accuracy}", EXIT_BELOW_THRESHOLD)
+
+
+def build_parser():
+    from scoring import DEFAULT_CHUNKSIZE, FORMATS
+
+    parser = argparse.ArgumentParser(description="Train, score and evaluate the tenant screening model offline.")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    train = commands.add_parser('train', help="train and publish a model")
+    train.add_argument('data', nargs='+', help="CSV files, directories or glob patterns")
+    train.add_argument('--estimator', default=None, help="default: random_forest")
+    train.add_argument('--params', default=None, help="estimator parameters as JSON")
+    train.add_argument('--n-jobs', type=int, default=-1, help="cores used while fitting")
+    train.add_argument('--incremental', action='store_true', help="grow the current forest with the new rows")
+    train.add_argument('--extra-estimators', type=int, default=None, help="trees added by --incremental (default: 10)")
+    train.add_argument('--compress', type=int, default=None, help="joblib compression level (0-9, default: 0)")
+    train.add_argument('--quantize', choices=('float32', 'float16', 'uint16'), default=None)
+    train.add_argument('--prune-depth', type=int, default=None)
+    train.add_argument('--workers', type=int, default=None, help="processes parsing the input files")
+    train.add_argument('-o', '--output', default='-', help="write the training report here")
+    train.set_defaults(func=cmd_train)
+
+    score = commands.add_parser('score', help="score a CSV of applicants")
+    score.add_argument('input', help="CSV file with the feature columns, or '-' for stdin")
+    score.add_argument('-o', '--output', default='-', help="output file, or '-' for stdout")
+    score.add_argument('-f', '--format', choices=FORMATS, default='ndjson')
+    score.add_argument('-c', '--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    score.add_argument('-j', '--workers', type=int, default=os.cpu_count() or 1,
+                       help="scoring processes (1 scores in this process)")
+    score.set_defaults(func=cmd_score)
+
+    evaluate = commands.add_parser('evaluate', help="measure the live model on labelled data")
+    evaluate.add_argument('data', nargs='+', help="labelled CSV files, directories or glob patterns")
+    evaluate.add_argument('--min-accuracy', type=float, default=None,
+                          help=f"exit with {EXIT_BELOW_THRESHOLD} when accuracy is lower")
+    evaluate.add_argument('--workers', type=int, default=None, help="processes parsing the input files")
+    evaluate.add_argument('-o', '--output', default='-', help="write the evaluation report here")
+    evaluate.set_defaults(func=cmd_evaluate)
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    timings = {'command': args.command}
+    started = time.perf_counter()
+    try:
+        args.func(args, timings)
+        exit_code = EXIT_OK
+    except CommandError as e:
+        exit_code = e.exit_code
+        timings['error'] = str(e)
+    except (FileNotFoundError, ValueError) as e:
+        exit_code = EXIT_BAD_INPUT
+        timings['error'] = str(e)
+    except Exception as e:
+        exit_code = EXIT_FAILURE
+        timings['error'] = f"{type(e).__name__}: {e}"
+
+    timings.update({'exit_code': exit_code, 'seconds': time.perf_counter() - started})
+    print(json.dumps(timings, default=str), file=sys.stderr)
+    return exit_code
+
+
+if __name__ == "__main__":
+    sys.exit(main())
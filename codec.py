@@ -0,0 +1,92 @@
+import zlib
+
+import numpy as np
+
+# Compact binary request/response format for high-volume clients: a packed
+# little-endian float32 matrix in row-major order, optionally compressed.
+#
+#   request   Content-Type: application/x-float32-matrix
+#             body = n_rows x 6 float32 values (FEATURE_COLUMNS order)
+#   response  same content type, n_rows x 2 float32 (prediction, confidence)
+#
+# Content-Encoding may be gzip, deflate or zstd (zstd needs the optional
+# `zstandard` package); the response uses the request's encoding.
+
+MATRIX_MIMETYPE = 'application/x-float32-matrix'
+MATRIX_DTYPE = np.dtype('<f4')
+SHAPE_HEADER = 'X-Matrix-Shape'
+
+# Upper bound on a decompressed body, so a small upload cannot expand
+# without limit
+MAX_DECODED_BYTES = 256 * 1024 * 1024
+
+
+class UnsupportedEncoding(ValueError):
+    pass
+
+
+def _zstd():
+    try:
+        import zstandard
+    except ImportError:
+        raise UnsupportedEncoding("zstd encoding requires the 'zstandard' package") from None
+    return zstandard
+
+
+def _inflate(body, wbits):
+    decompressor = zlib.decompressobj(wbits)
+    try:
+        data = decompressor.decompress(body, MAX_DECODED_BYTES)
+    except zlib.error as e:
+        raise ValueError(f"Body could not be decompressed: {e}") from None
+    if decompressor.unconsumed_tail:
+        raise ValueError("Decoded body is too large")
+    return data
+
+
+def decompress(body, encoding):
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return body
+    if encoding in ('gzip', 'x-gzip'):
+        return _inflate(body, 16 + zlib.MAX_WBITS)
+    if encoding == 'deflate':
+        return _inflate(body, zlib.MAX_WBITS)
+    if encoding == 'zstd':
+        zstandard = _zstd()
+        try:
+            data = zstandard.ZstdDecompressor().stream_reader(body).read(MAX_DECODED_BYTES + 1)
+        except zstandard.ZstdError as e:
+            raise ValueError(f"Body could not be decompressed: {e}") from None
+        if len(data) > MAX_DECODED_BYTES:
+            raise ValueError("Decoded body is too large")
+        return data
+    raise UnsupportedEncoding(f"Unsupported Content-Encoding '{encoding}'")
+
+
+def compress(data, encoding):
+    encoding = (encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return data
+    if encoding in ('gzip', 'x-gzip'):
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(data) + compressor.flush()
+    if encoding == 'deflate':
+        return zlib.compress(data, 6)
+    if encoding == 'zstd':
+        return _zstd().ZstdCompressor(level=3).compress(data)
+    raise UnsupportedEncoding(f"Unsupported Content-Encoding '{encoding}'")
+
+
+def decode_matrix(body, n_columns, encoding=None):
+    # A read-only view over the (decompressed) request bytes; no copy
+    data = decompress(body, encoding)
+    row_bytes = n_columns * MATRIX_DTYPE.itemsize
+    if len(data) % row_bytes:
+        raise ValueError(f"Body is not a whole number of {n_columns}-column float32 rows")
+    return np.frombuffer(data, dtype=MATRIX_DTYPE).reshape(-1, n_columns)
+
+
+def encode_matrix(matrix, encoding=None):
+    matrix = np.ascontiguousarray(matrix, dtype=MATRIX_DTYPE)
+    return compress(matrix.tobytes(), encoding), f"{matrix.shape[0]},{matrix.shape[1]}"
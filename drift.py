@@ -0,0 +1,291 @@
+from bisect import bisect_right
+import math
+import os
+import random
+import threading
+import time
+
+import numpy as np
+
+from metrics import Gauge, registry as metrics_registry
+from src.parse import FEATURE_COLUMNS
+
+# Reference bins are the training deciles of each feature, plus one open
+# bin at each end
+REFERENCE_QUANTILES = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9)
+REPORT_QUANTILES = (0.1, 0.5, 0.9)
+
+# Values outside these ranges are counted as invalid (they are still scored)
+VALID_RANGES = {
+    'MonthlyIncome': (0.0, math.inf),
+    'FICOScore': (300.0, 850.0),
+    'RentToIncomeRatio': (0.0, math.inf),
+    'HasCriminalRecord': (0.0, 1.0),
+    'HasEvictionHistory': (0.0, 1.0),
+    'AssetMonthlyValue': (0.0, math.inf)
+}
+
+# Population stability index thresholds (the usual rule of thumb)
+PSI_MODERATE = 0.1
+PSI_SIGNIFICANT = 0.25
+PSI_EPSILON = 1e-4  # stands in for empty bins so the log stays finite
+
+# Size of the live-traffic quantile sketches; rank error stays around 1%
+SKETCH_K = 200
+
+drift_psi = metrics_registry.register(Gauge(
+    'tenant_drift_psi', 'Population stability index of live traffic against the training data.', ('feature',)
+))
+drift_rows = metrics_registry.register(Gauge(
+    'tenant_drift_observed_rows', 'Rows observed by the drift monitor for the live model version.'
+))
+
+
+def build_reference(X, predictions):
+    # Training-time profile saved with the model metadata: per-feature bin
+    # edges and proportions, a few quantiles, and the predicted positive rate
+    features = []
+    for j, name in enumerate(FEATURE_COLUMNS):
+        values = X[:, j]
+        finite = values[np.isfinite(values)]
+        if len(finite):
+            edges = np.unique(np.quantile(finite, REFERENCE_QUANTILES))
+            quantiles = np.quantile(finite, REPORT_QUANTILES).tolist()
+        else:
+            edges, quantiles = np.empty(0), [None] * len(REPORT_QUANTILES)
+        # Features with few distinct values (the 0/1 flags) get one bin per
+        # value, otherwise a rare value would share the bin of a common one
+        distinct = np.unique(finite)
+        discrete = 0 < len(distinct) <= len(REFERENCE_QUANTILES) + 1
+        if discrete:
+            edges = distinct
+        counts = np.bincount(np.searchsorted(edges, finite, side='right'), minlength=len(edges) + 1)
+        features.append({
+            'name': name,
+            'edges': edges.tolist(),
+            'proportions': (counts / max(len(finite), 1)).tolist(),
+            'quantiles': quantiles,
+            'discrete': discrete,
+            'missing_rate': 1 - len(finite) / max(len(values), 1)
+        })
+    return {
+        'samples': len(X),
+        'features': features,
+        'positive_rate': float(np.mean(np.asarray(predictions) == 1)) if len(predictions) else None
+    }
+
+
+def psi(expected, actual):
+    expected = np.clip(np.asarray(expected, dtype=np.float64), PSI_EPSILON, None)
+    actual = np.clip(np.asarray(actual, dtype=np.float64), PSI_EPSILON, None)
+    return float(((actual - expected) * np.log(actual / expected)).sum())
+
+
+def _status(score):
+    if score is None:
+        return 'insufficient_data'
+    if score >= PSI_SIGNIFICANT:
+        return 'significant'
+    if score >= PSI_MODERATE:
+        return 'moderate'
+    return 'stable'
+
+
+class QuantileSketch:
+    # KLL-style streaming quantile sketch. Level h holds values that each
+    # stand for 2**h observations; when a level fills up it is sorted and
+    # every other value (from a random start) moves up a level. Lower levels
+    # get geometrically smaller capacities, so memory stays under 3 * k
+    # values however many rows are seen, and the quantiles are those of the
+    # observed values, wherever they fall relative to the training data.
+
+    def __init__(self, k=SKETCH_K):
+        self.k = k
+        self.count = 0
+        self._levels = [[]]
+        self._random = random.Random()
+
+    def _capacity(self, level):
+        return max(int(self.k * (2 / 3) ** (len(self._levels) - level - 1)), 2)
+
+    def add(self, value):
+        self._levels[0].append(value)
+        self.count += 1
+        if len(self._levels[0]) >= self._capacity(0):
+            self._compact()
+
+    def extend(self, values):
+        self._levels[0].extend(values.tolist())
+        self.count += len(values)
+        if len(self._levels[0]) >= self._capacity(0):
+            self._compact()
+
+    def _compact(self):
+        level = 0
+        while level < len(self._levels):
+            items = self._levels[level]
+            if len(items) >= self._capacity(level):
+                if level + 1 == len(self._levels):
+                    self._levels.append([])
+                items.sort()
+                # An odd value out stays behind so the total weight is kept
+                keep = [items.pop()] if len(items) % 2 else []
+                self._levels[level + 1].extend(items[self._random.getrandbits(1)::2])
+                self._levels[level] = keep
+            level += 1
+
+    def quantiles(self, qs):
+        if not self.count:
+            return [None] * len(qs)
+        values = np.concatenate([np.asarray(items, dtype=np.float64) for items in self._levels])
+        weights = np.concatenate([np.full(len(items), 2 ** level) for level, items in enumerate(self._levels)])
+        order = np.argsort(values, kind='stable')
+        values, cumulative = values[order], np.cumsum(weights[order])
+        ranks = np.searchsorted(cumulative, np.asarray(qs) * cumulative[-1])
+        return values[np.minimum(ranks, len(values) - 1)].tolist()
+
+
+class DriftMonitor:
+    # Running statistics of the features and predictions served by the live
+    # model version, compared with the reference profile in its metadata.
+    # Memory is fixed: one counter per reference bin (for PSI), a quantile
+    # sketch, missing/invalid counts and min/max per feature. Single rows are binned with bisect on
+    # plain lists so the /predict path allocates almost nothing; batches are
+    # binned with searchsorted/bincount. Counts start again when a new
+    # version goes live.
+
+    def __init__(self, enabled=True, min_samples=100):
+        self.enabled = enabled
+        self.min_samples = min_samples
+        self._lock = threading.Lock()
+        self._version = None
+        self._reset(None)
+
+    def _reset(self, state):
+        reference = state.metadata.get('drift_reference') if state is not None else None
+        self._version = state.version if state is not None else None
+        self._reference = reference
+        self._edges = [feature['edges'] for feature in reference['features']] if reference else [[]] * len(FEATURE_COLUMNS)
+        self._counts = [[0] * (len(edges) + 1) for edges in self._edges]
+        self._sketches = [QuantileSketch() for _ in FEATURE_COLUMNS]
+        self._ranges = [VALID_RANGES[name] for name in FEATURE_COLUMNS]
+        self._missing = [0] * len(FEATURE_COLUMNS)
+        self._invalid = [0] * len(FEATURE_COLUMNS)
+        self._min = [math.inf] * len(FEATURE_COLUMNS)
+        self._max = [-math.inf] * len(FEATURE_COLUMNS)
+        self._rows = 0
+        self._positives = 0
+        self._since = time.time()
+
+    def reset(self):
+        with self._lock:
+            self._version = None
+            self._reset(None)
+
+    def observe_row(self, state, features, prediction):
+        if not self.enabled:
+            return
+        with self._lock:
+            if state.version != self._version:
+                self._reset(state)
+            self._rows += 1
+            self._positives += prediction == 1
+            for j, value in enumerate(features):
+                value = float(value)
+                if value != value:
+                    self._missing[j] += 1
+                    continue
+                if value in (math.inf, -math.inf):
+                    self._invalid[j] += 1
+                    continue
+                low, high = self._ranges[j]
+                if not low <= value <= high:
+                    self._invalid[j] += 1
+                self._counts[j][bisect_right(self._edges[j], value)] += 1
+                self._sketches[j].add(value)
+                if value < self._min[j]:
+                    self._min[j] = value
+                if value > self._max[j]:
+                    self._max[j] = value
+
+    def observe_batch(self, state, X, predictions):
+        if not self.enabled or len(X) == 0:
+            return
+        X = np.asarray(X, dtype=np.float64)
+        with self._lock:
+            if state.version != self._version:
+                self._reset(state)
+            self._rows += len(X)
+            self._positives += int(np.count_nonzero(np.asarray(predictions) == 1))
+            for j in range(X.shape[1]):
+                column = X[:, j]
+                finite = column[np.isfinite(column)]
+                n_nan = int(np.count_nonzero(np.isnan(column)))
+                low, high = self._ranges[j]
+                self._missing[j] += n_nan
+                self._invalid[j] += len(column) - len(finite) - n_nan
+                self._invalid[j] += int(np.count_nonzero((finite < low) | (finite > high)))
+                if not len(finite):
+                    continue
+                bins = np.bincount(np.searchsorted(self._edges[j], finite, side='right'), minlength=len(self._counts[j]))
+                counts = self._counts[j]
+                for i, count in enumerate(bins.tolist()):
+                    counts[i] += count
+                self._sketches[j].extend(finite)
+                self._min[j] = min(self._min[j], float(finite.min()))
+                self._max[j] = max(self._max[j], float(finite.max()))
+
+    def report(self):
+        with self._lock:
+            reference = self._reference
+            features = []
+            for j, name in enumerate(FEATURE_COLUMNS):
+                counts = self._counts[j]
+                observed = sum(counts)
+                entry = {
+                    'name': name,
+                    'observed': observed,
+                    'missing': self._missing[j],
+                    'invalid': self._invalid[j],
+                    'missing_rate': self._missing[j] / self._rows if self._rows else None,
+                    'invalid_rate': self._invalid[j] / self._rows if self._rows else None,
+                    'min': self._min[j] if observed else None,
+                    'max': self._max[j] if observed else None,
+                    'quantiles': self._sketches[j].quantiles(REPORT_QUANTILES),
+                    'psi': None
+                }
+                if reference is not None:
+                    entry['reference_quantiles'] = reference['features'][j]['quantiles']
+                    if observed >= self.min_samples:
+                        entry['psi'] = psi(reference['features'][j]['proportions'], [c / observed for c in counts])
+                entry['status'] = _status(entry['psi'])
+                features.append(entry)
+
+            report = {
+                'model_version': self._version,
+                'since': self._since,
+                'rows': self._rows,
+                'has_reference': reference is not None,
+                'quantile_levels': list(REPORT_QUANTILES),
+                'predictions': {
+                    'count': self._rows,
+                    'positive_rate': self._positives / self._rows if self._rows else None,
+                    'reference_positive_rate': reference['positive_rate'] if reference else None
+                },
+                'features': features
+            }
+
+        drift_rows.set(report['rows'])
+        for entry in features:
+            if entry['psi'] is not None:
+                drift_psi.set(entry['psi'], feature=entry['name'])
+        scores = [entry['psi'] for entry in features if entry['psi'] is not None]
+        report['max_psi'] = max(scores) if scores else None
+        report['status'] = _status(report['max_psi'])
+        return report
+
+
+drift_monitor = DriftMonitor(
+    enabled=os.environ.get('TENANT_DRIFT_MONITOR', '1') == '1',
+    min_samples=int(os.environ.get('DRIFT_MIN_SAMPLES', '100'))
+)
@@ -0,0 +1,92 @@
+import threading
+
+import numpy as np
+
+from forest_engine import BATCH_ROWS, compile_forest
+
+
+class ForestExplainer:
+    # Saabas tree-path attributions on a CompiledForest. Walking a row down
+    # a tree, every split moves the node value (class probabilities) from
+    # the parent's to the child's; that change is credited to the parent's
+    # split feature. Averaged over trees, the root value (bias) plus the
+    # per-feature sums equals the forest's predict_proba exactly.
+    #
+    # The per-edge changes are precomputed once per model version, so
+    # explaining a batch is the same array traversal as scoring it plus one
+    # bincount per class and step.
+
+    def __init__(self, compiled):
+        self.compiled = compiled
+        self.n_trees = len(compiled.roots)
+        value = compiled.node_values()
+        self.left_delta = value[compiled.left] - value
+        self.right_delta = value[compiled.right] - value
+        self.bias = value[compiled.roots].mean(axis=0)
+
+    def _contributions(self, X):
+        compiled = self.compiled
+        n_rows, n_columns = X.shape
+        n_classes = compiled.value.shape[1]
+        node = np.tile(compiled.roots, n_rows)
+        row = np.repeat(np.arange(n_rows, dtype=np.intp), self.n_trees)
+        values = X.ravel()
+        missing = compiled.has_missing(values)
+        totals = np.zeros((n_classes, n_rows * n_columns))
+
+        active = np.flatnonzero(~compiled.is_leaf[node])
+        while active.size:
+            current = node[active]
+            # Index of (row, split feature), both into X and into the totals
+            slot = row[active] * n_columns + compiled.feature[current]
+            go_right = compiled.go_right(values[slot], current, missing)
+            delta = np.where(go_right[:, None], self.right_delta[current], self.left_delta[current])
+            for k in range(n_classes):
+                totals[k] += np.bincount(slot, weights=delta[:, k], minlength=len(totals[k]))
+
+            current = np.where(go_right, compiled.right[current], compiled.left[current])
+            node[active] = current
+            active = active[~compiled.is_leaf[current]]
+
+        # The probabilities come from the leaves, as in predict_proba, so
+        # ties are decided exactly as when scoring; contributions are
+        # (rows, features, classes), averaged over trees
+        proba = compiled._mean_value(node.reshape(n_rows, self.n_trees), axis=1)
+        return proba, totals.reshape(n_classes, n_rows, n_columns).transpose(1, 2, 0) / self.n_trees
+
+    def explain(self, X):
+        # Returns (proba, contributions) with contributions shaped
+        # (rows, features, classes); bias + contributions.sum(1) == proba
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        proba = np.empty((len(X), self.compiled.value.shape[1]))
+        contributions = np.empty(X.shape + (self.compiled.value.shape[1],))
+        for start in range(0, len(X), BATCH_ROWS):
+            stop = start + BATCH_ROWS
+            proba[start:stop], contributions[start:stop] = self._contributions(X[start:stop])
+        return proba, contributions
+
+
+# Explainers of recent model versions; building one walks every node once
+_explainers = {}
+_lock = threading.Lock()
+MAX_CACHED_EXPLAINERS = 2
+
+
+def explainer_for(state):
+    # The explainer for a registry ModelState, built on first use. Versions
+    # without an exported compiled forest are compiled here; returns None for
+    # estimators that are not tree ensembles
+    explainer = _explainers.get(state.version)
+    if explainer is not None:
+        return explainer
+    with _lock:
+        explainer = _explainers.get(state.version)
+        if explainer is None:
+            compiled = state.compiled if state.compiled is not None else compile_forest(state.model, state.scaler)
+            if compiled is None:
+                return None
+            explainer = ForestExplainer(compiled)
+            while len(_explainers) >= MAX_CACHED_EXPLAINERS:
+                _explainers.pop(next(iter(_explainers)))
+            _explainers[state.version] = explainer
+    return explainer
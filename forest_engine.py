@@ -0,0 +1,245 @@
+import numpy as np
+
+# Rows scored per traversal pass; bounds the (rows x trees) node index matrix
+BATCH_ROWS = 4096
+
+
+class CompiledForest:
+    # A fitted tree ensemble flattened into contiguous node arrays. All trees
+    # share one set of arrays; roots holds the index of each tree's first
+    # node. Leaves point to themselves and carry an infinite threshold, so a
+    # fixed number of steps (the deepest tree's depth) lands every row on its
+    # leaf without per-node branching. Thresholds are expressed in raw
+    # feature units, with the StandardScaler already folded in. A missing
+    # (NaN) value goes to the child sklearn sends it to: missing_left per
+    # node, learned in training or else the child with more samples.
+
+    # Defaults for forests pickled before these attributes existed
+    value_scale = None
+    exact = True
+    missing_left = None
+
+    def __init__(self, feature, threshold, left, right, value, roots, max_depth, classes, value_scale=None,
+                 exact=True, missing_left=None):
+        self.feature = feature
+        self.threshold = threshold
+        self.left = left
+        self.right = right
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        # Integer-quantized values are probabilities times 1 / value_scale
+        self.value_scale = value_scale
+        # False once quantized or pruned: no longer identical to sklearn
+        self.exact = exact
+        self.missing_left = missing_left
+        self.is_leaf = left == np.arange(len(left), dtype=left.dtype)
+
+    def node_values(self):
+        # Class probabilities of every node as float64
+        value = self.value.astype(np.float64)
+        return value * self.value_scale if self.value_scale is not None else value
+
+    def _mean_value(self, node, axis):
+        proba = self.value[node].mean(axis=axis, dtype=np.float64)
+        return proba * self.value_scale if self.value_scale is not None else proba
+
+    @property
+    def n_features(self):
+        return int(self.feature.max()) + 1 if len(self.feature) else 0
+
+    @property
+    def nbytes(self):
+        return sum(a.nbytes for a in (self.feature, self.threshold, self.left, self.right, self.value, self.roots))
+
+    def has_missing(self, X):
+        # Whether NaN routing is needed; NaN-free input skips it entirely
+        return self.missing_left is not None and bool(np.isnan(X).any())
+
+    def go_right(self, values, node, missing=False):
+        # Split decision for each (value, node) pair. NaN compares False and
+        # so goes left unless sklearn sends it right at that node
+        go_right = values > self.threshold[node]
+        if missing:
+            go_right |= np.isnan(values) & ~self.missing_left[node]
+        return go_right
+
+    def _leaves(self, X):
+        # Leaf index for every (row, tree) pair, flattened row-major. Only the
+        # pairs that have not reached a leaf yet are advanced at each step
+        n_rows, n_features = X.shape
+        n_trees = len(self.roots)
+        node = np.tile(self.roots, n_rows)
+        row_offset = np.repeat(np.arange(n_rows, dtype=np.intp) * n_features, n_trees)
+        values = X.ravel()
+        missing = self.has_missing(values)
+
+        active = np.flatnonzero(~self.is_leaf[node])
+        while active.size:
+            current = node[active]
+            go_right = self.go_right(values[row_offset[active] + self.feature[current]], current, missing)
+            current = np.where(go_right, self.right[current], self.left[current])
+            node[active] = current
+            active = active[~self.is_leaf[current]]
+        return node.reshape(n_rows, n_trees)
+
+    def predict_proba(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        proba = np.empty((len(X), self.value.shape[1]))
+        for start in range(0, len(X), BATCH_ROWS):
+            stop = start + BATCH_ROWS
+            proba[start:stop] = self._mean_value(self._leaves(X[start:stop]), axis=1)
+        return proba
+
+    def predict_proba_row(self, x):
+        # Single-row fast path: one vector of node indices, one per tree
+        x = np.asarray(x, dtype=np.float64).ravel()
+        missing = self.has_missing(x)
+        node = self.roots
+        for _ in range(self.max_depth):
+            node = np.where(self.go_right(x[self.feature[node]], node, missing), self.right[node], self.left[node])
+        return self._mean_value(node, axis=0)
+
+
+def _float32_boundary(threshold):
+    # sklearn casts inputs to float32 before comparing them with the float64
+    # thresholds, so a split really is "float32(x) <= t". Replace t with the
+    # float64 point where float32 rounding flips from the largest float32 at
+    # or below t to the next one up; comparing unrounded values against it
+    # gives the same decisions. A value exactly halfway rounds to the
+    # neighbour with an even mantissa; when that is the upper one, the
+    # midpoint itself already goes right.
+    below = threshold.astype(np.float32)
+    below = np.where(below > threshold, np.nextafter(below, np.float32(-np.inf)), below)
+    above = np.nextafter(below, np.float32(np.inf))
+    midpoint = (below.astype(np.float64) + above.astype(np.float64)) / 2
+    return np.where((above.view(np.uint32) & 1) == 0, np.nextafter(midpoint, -np.inf), midpoint)
+
+
+def compile_forest(model, scaler=None):
+    # Flatten a fitted RandomForestClassifier / ExtraTreesClassifier; returns
+    # None for estimators that are not tree ensembles
+    trees = [getattr(estimator, 'tree_', None) for estimator in getattr(model, 'estimators_', [])]
+    if not trees or any(tree is None for tree in trees) or getattr(model, 'n_outputs_', 1) != 1:
+        return None
+
+    mean = getattr(scaler, 'mean_', None)
+    scale = getattr(scaler, 'scale_', None)
+
+    features, thresholds, lefts, rights, values, missing_lefts, roots = [], [], [], [], [], [], []
+    offset = 0
+    for tree in trees:
+        n_nodes = tree.node_count
+        node_ids = np.arange(n_nodes)
+        is_leaf = tree.children_left == -1
+
+        feature = np.where(is_leaf, 0, tree.feature)
+        threshold = _float32_boundary(tree.threshold)
+
+        # x_scaled <= t  <=>  x <= t * scale + mean  (scale is always > 0).
+        # Splits that only separate missing values have a threshold of
+        # float max, which may overflow to inf here; it stays above every x
+        with np.errstate(over='ignore'):
+            if scale is not None:
+                threshold = threshold * scale[feature]
+            if mean is not None:
+                threshold = threshold + mean[feature]
+        threshold[is_leaf] = np.inf
+
+        value = tree.value[:, 0, :].astype(np.float64)
+        value /= value.sum(axis=1, keepdims=True)
+
+        # sklearn without missing-value support sends NaN nowhere (it raises)
+        missing_left = getattr(tree, 'missing_go_to_left', None)
+        missing_left = np.ones(n_nodes, dtype=bool) if missing_left is None else np.asarray(missing_left, dtype=bool)
+
+        features.append(feature.astype(np.int32))
+        thresholds.append(threshold)
+        lefts.append(np.where(is_leaf, node_ids, tree.children_left).astype(np.int32) + offset)
+        rights.append(np.where(is_leaf, node_ids, tree.children_right).astype(np.int32) + offset)
+        values.append(value)
+        missing_lefts.append(missing_left | is_leaf)
+        roots.append(offset)
+        offset += n_nodes
+
+    return CompiledForest(
+        feature=np.concatenate(features),
+        threshold=np.concatenate(thresholds),
+        left=np.concatenate(lefts),
+        right=np.concatenate(rights),
+        value=np.concatenate(values),
+        roots=np.asarray(roots, dtype=np.int32),
+        max_depth=max(tree.max_depth for tree in trees),
+        classes=np.asarray(model.classes_),
+        missing_left=np.concatenate(missing_lefts)
+    )
+
+
+def node_depths(compiled):
+    # Depth of every node reachable from a root, -1 for the rest
+    depth = np.full(len(compiled.left), -1, dtype=np.int32)
+    current = compiled.roots
+    level = 0
+    while current.size:
+        depth[current] = level
+        current = current[~compiled.is_leaf[current]]
+        current = np.concatenate((compiled.left[current], compiled.right[current]))
+        level += 1
+    return depth
+
+
+def quantize_forest(compiled, dtype=None, max_depth=None):
+    # Smaller copy of a compiled forest. max_depth turns the nodes at that
+    # depth into leaves (keeping their class distribution) and drops the
+    # subtrees below; dtype stores thresholds as float32 and leaf values as
+    # 'float32', 'float16' or 'uint16' (probability * 65535). Predictions
+    # can change, so the result must be checked against held-out data.
+    left, right = compiled.left.copy(), compiled.right.copy()
+    threshold = compiled.threshold.copy()
+    depth = node_depths(compiled)
+    tree_depth = compiled.max_depth
+    keep = depth >= 0
+
+    if max_depth is not None and max_depth < compiled.max_depth:
+        cut = np.flatnonzero((depth == max_depth) & ~compiled.is_leaf)
+        left[cut] = cut
+        right[cut] = cut
+        threshold[cut] = np.inf
+        keep &= depth <= max_depth
+        tree_depth = max_depth
+
+    # Renumber the remaining nodes contiguously
+    new_index = np.cumsum(keep, dtype=np.int64) - 1
+    index_dtype = np.int32 if keep.sum() > np.iinfo(np.uint16).max else np.uint16
+    left = new_index[left[keep]].astype(index_dtype)
+    right = new_index[right[keep]].astype(index_dtype)
+    threshold = threshold[keep]
+    value = compiled.node_values()[keep]
+    value_scale = None
+
+    if dtype is not None:
+        threshold = threshold.astype(np.float32)
+        if dtype == 'uint16':
+            value = np.round(value * 65535).astype(np.uint16)
+            value_scale = 1 / 65535
+        elif dtype in ('float16', 'float32'):
+            value = value.astype(dtype)
+        else:
+            raise ValueError(f"Unknown quantization dtype '{dtype}', expected float32, float16 or uint16")
+
+    n_features = max(compiled.n_features, 1)
+    feature_dtype = np.uint8 if n_features <= np.iinfo(np.uint8).max else np.int32
+    return CompiledForest(
+        feature=compiled.feature[keep].astype(feature_dtype),
+        threshold=threshold,
+        left=left,
+        right=right,
+        value=value,
+        roots=new_index[compiled.roots].astype(index_dtype),
+        max_depth=tree_depth,
+        classes=compiled.classes_,
+        value_scale=value_scale,
+        exact=False,
+        missing_left=compiled.missing_left[keep] if compiled.missing_left is not None else None
+    )
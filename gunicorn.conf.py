@@ -0,0 +1,42 @@
+import os
+import shutil
+import tempfile
+
+# Import the app (and preload the model) once in the master, then fork
+# workers that share the memory-mapped artifacts copy-on-write
+os.environ.setdefault('TENANT_PRELOAD_MODEL', '1')
+preload_app = True
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+workers = int(os.environ.get('WEB_CONCURRENCY', '4'))
+
+# Threads per worker; with TENANT_MICROBATCH=1 the concurrent /predict
+# requests of a worker are scored together
+threads = int(os.environ.get('THREADS', '8'))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+# Workers write their metrics to files in this directory and /metrics adds
+# them up, so every scrape covers all workers. A fresh directory per server
+# keeps counts from an earlier run out.
+os.environ.setdefault('METRICS_MULTIPROC_DIR', os.path.join(tempfile.gettempdir(), f"tenant-metrics-{os.getpid()}"))
+
+
+def on_starting(server):
+    shutil.rmtree(os.environ['METRICS_MULTIPROC_DIR'], ignore_errors=True)
+    os.makedirs(os.environ['METRICS_MULTIPROC_DIR'])
+
+
+def post_fork(server, worker):
+    from metrics import registry
+
+    registry.start_flushing()
+
+
+def child_exit(server, worker):
+    from metrics import registry
+
+    registry.mark_process_dead(worker.pid)
+
+
+def on_exit(server):
+    shutil.rmtree(os.environ['METRICS_MULTIPROC_DIR'], ignore_errors=True)
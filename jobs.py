@@ -0,0 +1,139 @@
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import json
+import threading
+import time
+import traceback
+import uuid
+
+from model import INCREMENTAL_OPTIONS, train_incremental_report, train_model_report
+from src.parse import cache_entries, file_digest, parse_cached, resolve_paths
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+
+
+class TrainingJobQueue:
+    # Runs training jobs off the request thread. A single worker means jobs
+    # are executed one after another, so two runs never write the model
+    # artifacts at the same time; identical submissions (same file contents
+    # and options) that are still pending share one job.
+
+    def __init__(self, max_workers=1, max_history=100):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='train')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+        self._pending = {}  # dedup key -> job id, for queued/running jobs
+        self.max_history = max_history
+
+    def submit(self, data_path, options=None):
+        # data_path is a CSV file, a directory or glob of them, or a list
+        options = options or {}
+        if options.get('mode') == 'incremental':
+            unsupported = sorted(set(options) - {'mode', *INCREMENTAL_OPTIONS})
+            if unsupported:
+                raise ValueError(
+                    f"{', '.join(unsupported)} cannot be set for an incremental run; "
+                    "it keeps the settings of the current model"
+                )
+        paths = resolve_paths(data_path)
+        key = (tuple(file_digest(path) for path in paths), json.dumps(options, sort_keys=True))
+
+        with self._lock:
+            job_id = self._pending.get(key)
+            if job_id is not None:
+                return self._snapshot(self._jobs[job_id]), False
+
+            job = {
+                'id': uuid.uuid4().hex,
+                'status': QUEUED,
+                'data_path': data_path,
+                'files': len(paths),
+                'options': options,
+                'submitted_at': time.time(),
+                'started_at': None,
+                'finished_at': None,
+                'queue_seconds': None,
+                'parse_seconds': None,
+                'train_seconds': None,
+                'total_seconds': None,
+                'accuracy': None,
+                'samples': None,
+                'mode': None,
+                'retrain_reason': None,
+                'error': None
+            }
+            self._jobs[job['id']] = job
+            self._pending[key] = job['id']
+            self._trim()
+
+        self._executor.submit(self._run, job, key, paths)
+        return self._snapshot(job), True
+
+    def get(self, job_id):
+        with self._lock:
+            job = self._jobs.get(job_id)
+            return self._snapshot(job) if job is not None else None
+
+    def list(self):
+        with self._lock:
+            return [self._snapshot(job) for job in reversed(self._jobs.values())]
+
+    def _run(self, job, key, paths):
+        started = time.time()
+        self._update(job, status=RUNNING, started_at=started, queue_seconds=started - job['submitted_at'])
+        try:
+            # Files are parsed in parallel into the columnar cache, then
+            # combined; the cache entries are kept as the training sources
+            start = time.perf_counter()
+            sources = cache_entries(paths)
+            training_data = parse_cached(sources)
+            parse_seconds = time.perf_counter() - start
+            if len(training_data) == 0:
+                raise ValueError("No data could be parsed from file.")
+
+            # Incremental runs grow the current forest with the new rows
+            options = dict(job['options'])
+            train = train_incremental_report if options.pop('mode', 'full') == 'incremental' else train_model_report
+
+            start = time.perf_counter()
+            report = train(training_data, sources=sources, **options)
+            self._update(
+                job,
+                status=SUCCEEDED,
+                parse_seconds=parse_seconds,
+                train_seconds=time.perf_counter() - start,
+                accuracy=report['accuracy'],
+                samples=report['samples'],
+                mode=report['mode'],
+                retrain_reason=report.get('retrain_reason')
+            )
+            print(f"Training job {job['id']} finished. Accuracy: {report['accuracy']:.2%} using {report['samples']} samples.")
+        except Exception as e:
+            traceback.print_exc()
+            self._update(job, status=FAILED, error=str(e))
+        finally:
+            finished = time.time()
+            with self._lock:
+                job['finished_at'] = finished
+                job['total_seconds'] = finished - job['submitted_at']
+                self._pending.pop(key, None)
+
+    def _update(self, job, **fields):
+        with self._lock:
+            job.update(fields)
+
+    def _trim(self):
+        # Forget the oldest finished jobs once the history is full
+        finished = [job_id for job_id, job in self._jobs.items() if job['status'] in (SUCCEEDED, FAILED)]
+        for job_id in finished[:max(0, len(self._jobs) - self.max_history)]:
+            del self._jobs[job_id]
+
+    @staticmethod
+    def _snapshot(job):
+        return dict(job)
+
+
+training_jobs = TrainingJobQueue()
@@ -0,0 +1,321 @@
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+import json
+import math
+import os
+import threading
+import time
+import uuid
+
+# Minimal Prometheus-style metrics (text exposition format 0.0.4). Kept to
+# the standard library so importing it does not slow down server startup.
+#
+# Metrics live in the memory of one process. Under a multi-worker server set
+# METRICS_MULTIPROC_DIR (gunicorn.conf.py does): every worker then writes
+# its samples to a file there and /metrics adds up the files of all
+# workers, so a scrape sees the whole server whichever worker answers.
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+TRAINING_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1800.0, 3600.0)
+
+# Route of the request being served, used to label stage timings
+current_route = ContextVar('current_route', default='')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, labelvalues, extra=()):
+    pairs = list(zip(labelnames, labelvalues)) + list(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+def _format_value(value):
+    if value == math.inf:
+        return '+Inf'
+    return repr(float(value))
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def samples(self):
+        with self._lock:
+            return [[list(labelvalues), value] for labelvalues, value in self._values.items()]
+
+    def merge(self, snapshots):
+        # Combine the samples() of several processes, given as (pid, samples)
+        values = {}
+        for _, samples in snapshots:
+            for labelvalues, value in samples:
+                key = tuple(labelvalues)
+                values[key] = values.get(key, 0) + value
+        return values
+
+    def render(self, values=None):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        if values is None:
+            with self._lock:
+                values = dict(self._values)
+        for labelvalues, value in sorted(values.items()):
+            lines.extend(self._render_sample(labelvalues, value))
+        return lines
+
+    def _labels(self, labelvalues, extra=()):
+        return _format_labels(self.labelnames, labelvalues, extra)
+
+    def _render_sample(self, labelvalues, value):
+        return [f"{self.name}{self._labels(labelvalues)} {_format_value(value)}"]
+
+
+class Counter(_Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    # multiprocess_mode says how the values of several workers are combined:
+    # 'all' keeps one sample per worker with a pid label, 'latest' keeps the
+    # most recently set value
+    kind = 'gauge'
+
+    def __init__(self, name, help, labelnames=(), multiprocess_mode='all'):
+        super().__init__(name, help, labelnames)
+        self.multiprocess_mode = multiprocess_mode
+        self._updated = {}
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+            self._updated[key] = time.time()
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), value, self._updated[key]] for key, value in self._values.items()]
+
+    def merge(self, snapshots):
+        values, updated = {}, {}
+        for pid, samples in snapshots:
+            for labelvalues, value, set_at in samples:
+                key = tuple(labelvalues)
+                if self.multiprocess_mode == 'all':
+                    values[key + (str(pid),)] = value
+                elif set_at >= updated.get(key, -math.inf):
+                    values[key], updated[key] = value, set_at
+        return values
+
+    def _labels(self, labelvalues, extra=()):
+        if len(labelvalues) > len(self.labelnames):
+            # Merged per-worker sample; the last label value is the pid
+            extra = [('pid', labelvalues[-1])] + list(extra)
+            labelvalues = labelvalues[:-1]
+        return _format_labels(self.labelnames, labelvalues, extra)
+
+
+class Histogram(_Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labelnames=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket (non-cumulative) counts, then sum and count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def samples(self):
+        with self._lock:
+            return [[list(key), [list(counts), total, count]] for key, (counts, total, count) in self._values.items()]
+
+    def merge(self, snapshots):
+        values = {}
+        for _, samples in snapshots:
+            for labelvalues, (counts, total, count) in samples:
+                state = values.setdefault(tuple(labelvalues), [[0] * (len(self.buckets) + 1), 0.0, 0])
+                state[0] = [a + b for a, b in zip(state[0], counts)]
+                state[1] += total
+                state[2] += count
+        return values
+
+    def _render_sample(self, labelvalues, state):
+        counts, total, count = state
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets + (math.inf,), counts):
+            cumulative += bucket_count
+            labels = self._labels(labelvalues, [('le', _format_value(bound))])
+            lines.append(f"{self.name}_bucket{labels} {cumulative}")
+        labels = self._labels(labelvalues)
+        lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+        lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    # With multiprocess_dir set, each process writes its samples to
+    # <dir>/<pid>.json every flush_interval seconds (once start_flushing()
+    # has been called in it) and before rendering, and render() merges the
+    # files of every process. Other workers' numbers are therefore up to
+    # flush_interval old. Counters and histograms of exited workers are kept
+    # so totals never go backwards; their per-worker gauges are dropped.
+
+    def __init__(self, multiprocess_dir=None, flush_interval=1.0):
+        self._metrics = []
+        self.multiprocess_dir = multiprocess_dir
+        self.flush_interval = flush_interval
+        self._flusher_pid = None
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def _path(self, pid):
+        return os.path.join(self.multiprocess_dir, f"{pid}.json")
+
+    def _write(self, pid, snapshot):
+        os.makedirs(self.multiprocess_dir, exist_ok=True)
+        tmp_path = f"{self._path(pid)}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(snapshot, f)
+        os.replace(tmp_path, self._path(pid))
+
+    def flush(self):
+        # Write this process's samples to its file
+        if self.multiprocess_dir:
+            self._write(os.getpid(), {metric.name: metric.samples() for metric in self._metrics})
+
+    def start_flushing(self):
+        # Flush periodically from a daemon thread; call once in each worker
+        # after the fork (threads do not survive fork)
+        if not self.multiprocess_dir or self._flusher_pid == os.getpid():
+            return
+        self._flusher_pid = os.getpid()
+
+        def run():
+            while True:
+                time.sleep(self.flush_interval)
+                try:
+                    self.flush()
+                except OSError as e:
+                    print(f"Could not write metrics: {e}")
+
+        threading.Thread(target=run, name='metrics-flush', daemon=True).start()
+
+    def mark_process_dead(self, pid):
+        # Keep an exited worker's counters and histograms, drop its
+        # per-worker gauges
+        try:
+            with open(self._path(pid)) as f:
+                snapshot = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return
+        for metric in self._metrics:
+            if isinstance(metric, Gauge) and metric.multiprocess_mode == 'all':
+                snapshot.pop(metric.name, None)
+        self._write(pid, snapshot)
+
+    def _snapshots(self):
+        snapshots = []
+        for filename in os.listdir(self.multiprocess_dir):
+            if not filename.endswith('.json'):
+                continue
+            try:
+                with open(os.path.join(self.multiprocess_dir, filename)) as f:
+                    snapshots.append((filename[:-len('.json')], json.load(f)))
+            except (FileNotFoundError, ValueError):
+                continue  # replaced or removed while listing
+        return snapshots
+
+    def render(self):
+        lines = []
+        if self.multiprocess_dir:
+            self.flush()
+            snapshots = self._snapshots()
+            for metric in self._metrics:
+                merged = metric.merge([(pid, snapshot[metric.name]) for pid, snapshot in snapshots
+                                       if metric.name in snapshot])
+                lines.extend(metric.render(merged))
+        else:
+            for metric in self._metrics:
+                lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+registry = MetricsRegistry(
+    multiprocess_dir=os.environ.get('METRICS_MULTIPROC_DIR') or None,
+    flush_interval=float(os.environ.get('METRICS_FLUSH_INTERVAL', '1'))
+)
+
+request_seconds = registry.register(Histogram(
+    'tenant_request_duration_seconds', 'Request latency by route.', ('route', 'method', 'status')
+))
+requests_total = registry.register(Counter(
+    'tenant_requests_total', 'Requests served by route.', ('route', 'method', 'status')
+))
+request_errors_total = registry.register(Counter(
+    'tenant_request_errors_total', 'Requests that failed with a server error.', ('route',)
+))
+stage_seconds = registry.register(Histogram(
+    'tenant_stage_duration_seconds', 'Time spent in each stage of a request.', ('route', 'stage')
+))
+training_seconds = registry.register(Histogram(
+    'tenant_training_duration_seconds', 'Wall-clock time of train_model runs.', ('estimator',), TRAINING_BUCKETS
+))
+training_runs_total = registry.register(Counter(
+    'tenant_training_runs_total', 'Completed train_model runs.', ('estimator',)
+))
+training_samples = registry.register(Gauge(
+    'tenant_training_samples', 'Samples used by the last training run.', multiprocess_mode='latest'
+))
+training_accuracy = registry.register(Gauge(
+    'tenant_training_accuracy', 'Held-out accuracy of the last training run.', multiprocess_mode='latest'
+))
+service_state = registry.register(Gauge(
+    'tenant_service_state', 'Startup timings and prediction cache counters.', ('key',)
+))
+
+
+@contextmanager
+def stage(name):
+    # Time a block of request work, labelled with the current route
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - start, route=current_route.get() or 'none', stage=name)
+
+
+def record_training(report, seconds):
+    training_seconds.observe(seconds, estimator=report['estimator'])
+    training_runs_total.inc(estimator=report['estimator'])
+    training_samples.set(report['samples'])
+    training_accuracy.set(report['accuracy'])
@@ -0,0 +1,116 @@
+from concurrent.futures import Future
+import queue
+import threading
+import time
+
+import numpy as np
+
+from metrics import Histogram, registry as metrics_registry
+
+batch_sizes = metrics_registry.register(Histogram(
+    'tenant_microbatch_size', 'Rows scored per micro-batch.', (), (1, 2, 4, 8, 16, 32, 64, 128, 256, 512)
+))
+
+
+class MicroBatcher:
+    # Collects single-row requests from many threads and scores them together.
+    # A background thread takes the first waiting row, keeps collecting for
+    # up to max_wait_ms or until max_batch_size rows are in hand, and answers
+    # every caller from one vectorized score_fn(context, X) call. The context
+    # is whatever the caller submitted with its row (the model state it
+    # read), so a row is always scored with the caller's context; rows of
+    # different contexts collected together are scored in separate calls.
+    # When every request currently in flight is already in the batch it is
+    # dispatched at once, so a lone request does not sit out the whole
+    # window.
+
+    def __init__(self, score_fn, max_batch_size=64, max_wait_ms=2.0):
+        self.score_fn = score_fn
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._in_flight = 0
+        self._thread = None
+        self.batches = 0
+        self.rows = 0
+
+    def _ensure_started(self):
+        if self._thread is None or not self._thread.is_alive():
+            with self._lock:
+                if self._thread is None or not self._thread.is_alive():
+                    self._thread = threading.Thread(target=self._run, name='microbatch', daemon=True)
+                    self._thread.start()
+
+    def submit(self, row, context=None):
+        self._ensure_started()
+        future = Future()
+        with self._lock:
+            self._in_flight += 1
+        self._queue.put((row, context, future))
+        return future
+
+    def predict(self, row, context=None, timeout=None):
+        return self.submit(row, context).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+                continue
+            except queue.Empty:
+                pass
+            if len(batch) >= self._in_flight:
+                break
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            groups = {}
+            for row, context, future in batch:
+                groups.setdefault(id(context), (context, []))[1].append((row, future))
+            for context, group in groups.values():
+                self._score(context, group)
+
+    def _score(self, context, group):
+        futures = [future for _, future in group]
+        try:
+            X = np.array([row for row, _ in group], dtype=np.float64)
+            predictions, confidences = self.score_fn(context, X)
+            results = list(zip(predictions.tolist(), confidences.tolist()))
+        except Exception as e:
+            results = None
+            error = e
+
+        with self._lock:
+            self._in_flight -= len(group)
+            self.batches += 1
+            self.rows += len(group)
+        batch_sizes.observe(len(group))
+
+        for i, future in enumerate(futures):
+            if results is None:
+                future.set_exception(error)
+            else:
+                future.set_result(results[i])
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_batch_size': self.max_batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'batches': self.batches,
+                'rows': self.rows,
+                'mean_batch_size': self.rows / self.batches if self.batches else None,
+                'in_flight': self._in_flight
+            }
@@ -1,78 +1,695 @@
-import pandas as pd
+# Only what the prediction path needs is imported here; pandas and the
+# sklearn training modules are imported inside the training functions so a
+# serving process does not pay for them at startup
 import numpy as np
-from sklearn.model_selection import train_test_split
-from sklearn.ensemble import RandomForestClassifier
-from sklearn.preprocessing import StandardScaler
+import copy
+import hashlib
+import importlib
 import joblib
 import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
 
+from cache import prediction_cache
+from drift import build_reference, drift_monitor
+from metrics import record_training, stage
+from forest_engine import compile_forest, quantize_forest
+from src.parse import FEATURE_COLUMNS
+from store import STORE_DIR, TRAINING_PREFIX, ModelStore
+
+# Trained versions are published to the model store; these single-file
+# artifacts from earlier releases are still served until the first publish
 MODEL_PATH = 'tenant_model.joblib'
 SCALER_PATH = 'tenant_scaler.joblib'
+COMPILED_PATH = 'tenant_forest.joblib'
+
+# Up to this many rows the compiled forest beats sklearn's per-call
+# overhead; larger batches go through sklearn's Cython tree traversal
+COMPILED_MAX_ROWS = 256
+
+# Estimators selectable for training (imported on first use), with their
+# default parameters
+ESTIMATORS = {
+    'random_forest': ('sklearn.ensemble.RandomForestClassifier', {'n_estimators': 100, 'random_state': 42}),
+    'extra_trees': ('sklearn.ensemble.ExtraTreesClassifier', {'n_estimators': 100, 'random_state': 42}),
+    'hist_gradient_boosting': ('sklearn.ensemble.HistGradientBoostingClassifier', {'random_state': 42}),
+    'logistic_regression': ('sklearn.linear_model.LogisticRegression', {'max_iter': 1000}),
+}
+DEFAULT_ESTIMATOR = 'random_forest'
+DEFAULT_N_JOBS = -1  # use every core while fitting
+
+# Estimators that can grow extra trees on new rows with warm_start
+WARM_START_ESTIMATORS = ('random_forest', 'extra_trees')
+
+# Options an incremental run accepts; everything else (estimator, params,
+# artifact options) is inherited from the live version
+INCREMENTAL_OPTIONS = ('extra_estimators', 'n_jobs', 'policy')
+
+# How a version's artifacts are written: joblib compression level (0-9;
+# compressed files cannot be memory-mapped), compiled forest quantization
+# ('float32', 'float16' or 'uint16' values with float32 thresholds) and the
+# depth the compiled trees are cut at
+DEFAULT_ARTIFACT_OPTIONS = {'compress': 0, 'quantize': None, 'prune_depth': None}
+
+# When incremental training must give way to a full retrain
+DEFAULT_RETRAIN_POLICY = {
+    'max_delta_fraction': 0.5,        # one delta larger than this share of the base set
+    'max_incremental_fraction': 1.0,  # rows added since the last full fit, relative to its size
+    'max_estimators': 500,            # forest size cap
+    'max_mean_shift': 0.5,            # drift of any feature mean, in training standard deviations
+    'mean_shift_z': 2.0               # standard errors of the delta mean discounted before that test
+}
+
+
+ModelState = namedtuple('ModelState', ['signature', 'version', 'model', 'scaler', 'compiled', 'metadata'])
+
+
+def _version(signature):
+    # Short identifier of a legacy artifact set, used to key cached predictions
+    return hashlib.sha1(repr(signature).encode()).hexdigest()[:12]
+
+
+class ModelRegistry:
+    # Process-wide cache of the live model version: model, scaler, compiled
+    # forest (when one was exported) and metadata, kept in a single ModelState
+    # so readers always see a matching snapshot. The store's CURRENT pointer
+    # is re-read at most every check_interval seconds; when it moves, the new
+    # version is loaded and swapped in with one assignment while requests
+    # already running finish on the old one. Before anything has been
+    # published to the store, the legacy files at MODEL_PATH/SCALER_PATH are
+    # served instead. model is None for versions served by a quantized or
+    # pruned forest; training_model() reads it from the store.
+
+    def __init__(self, store, legacy_paths=None, check_interval=1.0, mmap_mode=None):
+        self.store = store
+        self.legacy_paths = legacy_paths
+        self.check_interval = check_interval
+        self.mmap_mode = mmap_mode
+        self._lock = threading.Lock()
+        self._state = None
+        self._last_check = 0.0
+
+    def _signature(self):
+        version = self.store.current()
+        if version is not None:
+            return ('store', version)
+        if self.legacy_paths is None:
+            return None
+
+        # Identify legacy files by inode, size and mtime so a replaced file
+        # is noticed even within the same second
+        signature = ['legacy']
+        model_path, scaler_path, compiled_path = self.legacy_paths
+        for path in (model_path, scaler_path, compiled_path):
+            try:
+                st = os.stat(path)
+            except FileNotFoundError:
+                if path != compiled_path:
+                    return None
+                signature.append(None)  # the compiled forest is optional
+                continue
+            signature.append((st.st_ino, st.st_size, st.st_mtime_ns))
+        return tuple(signature)
+
+    def _load(self):
+        # Versions in the store are immutable; legacy files are retried if
+        # they change while we are reading them
+        for _ in range(3):
+            signature = self._signature()
+            if signature is None:
+                raise FileNotFoundError("Model or scaler not found. Please train the model first.")
+            if signature[0] == 'store':
+                artifacts, metadata = self.store.load(signature[1], mmap_mode=self.mmap_mode)
+                state = ModelState(
+                    signature, signature[1], artifacts.get('model'), artifacts['scaler'], artifacts.get('compiled'), metadata
+                )
+                break
+
+            model_path, scaler_path, compiled_path = self.legacy_paths
+            model = joblib.load(model_path, mmap_mode=self.mmap_mode)
+            scaler = joblib.load(scaler_path, mmap_mode=self.mmap_mode)
+            compiled = joblib.load(compiled_path, mmap_mode=self.mmap_mode) if signature[3] is not None else None
+            state = ModelState(signature, _version(signature), model, scaler, compiled, {})
+            if self._signature() == signature:
+                break
+        self._state = state
+        return state
+
+    def get(self):
+        state = self._state
+        now = time.monotonic()
+        if state is not None and now - self._last_check < self.check_interval:
+            return state
+
+        signature = self._signature()
+        self._last_check = now
+        if state is None or signature != state.signature:
+            with self._lock:
+                state = self._state
+                if state is None or self._signature() != state.signature:
+                    state = self._load()
+        return state
+
+    @property
+    def loaded(self):
+        return self._state is not None
+
+    def reload(self):
+        with self._lock:
+            state = self._load()
+        self._last_check = time.monotonic()
+        return state
+
+    def publish(self, artifacts, metadata, compress=0):
+        # Write a new version to the store, make it live and install the
+        # in-memory objects without reading them back from disk (only those
+        # a load would read, so training-only artifacts are not kept alive)
+        with self._lock:
+            version = self.store.publish(artifacts, metadata, compress=compress)
+            self._state = ModelState(
+                ('store', version), version, artifacts.get('model'), artifacts['scaler'], artifacts.get('compiled'),
+                self.store.metadata(version)
+            )
+        self._last_check = time.monotonic()
+        return version
 
-def train_model(data):
-    # Convert list of lists to DataFrame
-    df = pd.DataFrame(data, columns=[
-        'MonthlyIncome',
-        'FICOScore',
-        'RentToIncomeRatio',
-        'HasCriminalRecord', 
-        'HasEvictionHistory',
-        'AssetMonthlyValue',
-        'ApplicationResult'
-    ])
-    
-    # Separate features and target
-    X = df[[
-        'MonthlyIncome',
-        'FICOScore',
-        'RentToIncomeRatio',
-        'HasCriminalRecord',
-        'HasEvictionHistory', 
-        'AssetMonthlyValue'
-    ]]
-    y = df['ApplicationResult']
+    def activate(self, version):
+        # Switch to (or roll back to) a stored version
+        self.store.activate(version)
+        return self.reload()
+
+
+store = ModelStore(STORE_DIR)
+registry = ModelRegistry(store, legacy_paths=(MODEL_PATH, SCALER_PATH, COMPILED_PATH))
+
+
+def preload(mmap_mode='r'):
+    # Load the artifacts up front, e.g. in a pre-fork server master. With
+    # mmap_mode the NumPy arrays (all of the compiled forest) are mapped from
+    # the files instead of copied onto the heap, so forked workers share the
+    # same pages rather than each holding a private copy. sklearn trees copy
+    # their node arrays when unpickled, so an exact version's sklearn forest
+    # is still private to each process; quantized and pruned versions do not
+    # load it at all.
+    registry.mmap_mode = mmap_mode
+    return registry.reload()
+
+
+def build_estimator(estimator=DEFAULT_ESTIMATOR, params=None, n_jobs=None):
+    if estimator not in ESTIMATORS:
+        raise ValueError(f"Unknown estimator '{estimator}', expected one of {', '.join(ESTIMATORS)}")
+    dotted_path, defaults = ESTIMATORS[estimator]
+    module_name, class_name = dotted_path.rsplit('.', 1)
+    cls = getattr(importlib.import_module(module_name), class_name)
+    model = cls(**{**defaults, **(params or {})})
+    if n_jobs is not None and 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=n_jobs)
+    return model
+
+# Training matrices shared with search worker processes, set once per worker
+_search_data = None
+
+def _init_search_worker(X, y):
+    global _search_data
+    _search_data = (X, y)
+
+def _evaluate_candidate(estimator, params, cv):
+    from sklearn.model_selection import cross_val_score
+    from sklearn.pipeline import make_pipeline
+    from sklearn.preprocessing import StandardScaler
+
+    X, y = _search_data
+    start = time.perf_counter()
+    # Each candidate runs single-threaded; the parallelism is across candidates
+    pipeline = make_pipeline(StandardScaler(), build_estimator(estimator, params, n_jobs=1))
+    scores = cross_val_score(pipeline, X, y, cv=cv)
+    return {
+        'params': params,
+        'mean_score': float(scores.mean()),
+        'std_score': float(scores.std()),
+        'seconds': time.perf_counter() - start
+    }
+
+def search_hyperparameters(X, y, param_grid, estimator=DEFAULT_ESTIMATOR, params=None, cv=5, max_workers=None):
+    # Cross-validate every candidate in the grid across a process pool and
+    # return the results sorted best first
+    from sklearn.model_selection import ParameterGrid
+
+    candidates = [{**(params or {}), **candidate} for candidate in ParameterGrid(param_grid)]
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_search_worker, initargs=(X, y)) as pool:
+        futures = [pool.submit(_evaluate_candidate, estimator, candidate, cv) for candidate in candidates]
+        results = [future.result() for future in futures]
+    return sorted(results, key=lambda result: result['mean_score'], reverse=True)
+
+def _features_and_target(data):
+    import pandas as pd
+
+    # Accept a parsed DataFrame, an array or a list of lists
+    if isinstance(data, pd.DataFrame):
+        df = data[FEATURE_COLUMNS + ['ApplicationResult']]
+    else:
+        df = pd.DataFrame(data, columns=FEATURE_COLUMNS + ['ApplicationResult'])
+    
+    # Separate features and target (plain arrays, so the scaler is not tied
+    # to column names and accepts the matrices built at prediction time)
+    X = df[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+    y = df['ApplicationResult'].to_numpy()
+    return X, y
+
+def train_model_report(data, estimator=DEFAULT_ESTIMATOR, params=None, n_jobs=DEFAULT_N_JOBS,
+                       param_grid=None, cv=5, search_workers=None, sources=None,
+                       compress=0, quantize=None, prune_depth=None):
+    from sklearn.model_selection import train_test_split
+    from sklearn.preprocessing import StandardScaler
+
+    started = time.perf_counter()
+    X, y = _features_and_target(data)
     
     # Split data
     X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
     
+    # Optionally pick the parameters by cross-validated search on the training split
+    search_results = None
+    params = dict(params or {})
+    if param_grid:
+        search_results = search_hyperparameters(
+            X_train, y_train, param_grid, estimator, params, cv=cv, max_workers=search_workers
+        )
+        params = search_results[0]['params']
+    
     # Scale features
     scaler = StandardScaler()
     X_train_scaled = scaler.fit_transform(X_train)
     X_test_scaled = scaler.transform(X_test)
     
     # Train model
-    model = RandomForestClassifier(n_estimators=100, random_state=42)
+    start = time.perf_counter()
+    model = build_estimator(estimator, params, n_jobs=n_jobs)
     model.fit(X_train_scaled, y_train)
+    fit_seconds = time.perf_counter() - start
     
-    # Save model and scaler
-    joblib.dump(model, MODEL_PATH)
-    joblib.dump(scaler, SCALER_PATH)
+    predicted = model.predict(X_test_scaled)
+    accuracy = np.mean(predicted == y_test)
+    report = {
+        'mode': 'full',
+        'accuracy': float(accuracy),
+        'samples': len(X),
+        'estimator': estimator,
+        'params': params,
+        'fit_seconds': fit_seconds,
+        'search': search_results
+    }
+    training_state = {
+        'estimator': estimator,
+        'params': params,
+        'base_samples': len(X),
+        'base_estimators': getattr(model, 'n_estimators', None),
+        'incremental_samples': 0,
+        'incremental_runs': 0,
+        'feature_stats': _feature_stats(X),
+        'sources': list(sources or []),
+        'artifacts': {'compress': compress, 'quantize': quantize, 'prune_depth': prune_depth},
+        'trained_at': time.time()
+    }
+    # Distribution of the training data, for drift monitoring while serving
+    reference = build_reference(X_train, predicted)
+    _publish(model, scaler, X_test, X_test_scaled, y_test, report, training_state, reference)
+    record_training(report, time.perf_counter() - started)
+    return report
+
+def _publish(model, scaler, X_check, X_check_scaled, y_check, report, training_state, drift_reference=None):
+    # Serving scores a handful of rows at a time, where spinning up a thread
+    # pool per call costs more than it saves
+    if 'n_jobs' in model.get_params():
+        model.set_params(n_jobs=None)
+    
+    # Export the array-based inference engine, checked against sklearn
+    compiled = export_compiled(model, scaler, X_check, X_check_scaled)
+    report['compiled'] = compiled is not None
+    options = {**DEFAULT_ARTIFACT_OPTIONS, **(training_state.get('artifacts') or {})}
+    if compiled is not None and (options['quantize'] or options['prune_depth']):
+        compiled, report['quantization'] = _quantize(compiled, options, X_check, y_check, report['accuracy'])
+    
+    # Save model, scaler and compiled forest as one new version. A quantized
+    # or pruned forest serves every request, so the sklearn forest is only
+    # kept to grow it in incremental runs and is not loaded for serving
+    artifacts = {'scaler': scaler}
+    if compiled is not None:
+        artifacts['compiled'] = compiled
+    if compiled is not None and not compiled.exact:
+        artifacts[TRAINING_PREFIX + 'model'] = model
+    else:
+        artifacts['model'] = model
+    metadata = {
+        'feature_columns': FEATURE_COLUMNS,
+        'classes': model.classes_.tolist(),
+        'metrics': {key: report[key] for key in ('mode', 'accuracy', 'samples', 'fit_seconds')},
+        'estimator': report['estimator'],
+        'params': report['params'],
+        'training': training_state,
+        'drift_reference': drift_reference
+    }
+    report['version'] = registry.publish(artifacts, metadata, compress=options['compress'])
+    report['artifacts'] = _artifact_report(report['version'])
+    return report['version']
+
+def _quantize(compiled, options, X_check, y_check, accuracy):
+    # Shrink the compiled forest and measure what it costs on the held-out rows
+    exact_proba = compiled.predict_proba(X_check)
+    quantized = quantize_forest(compiled, options['quantize'], options['prune_depth'])
+    proba = quantized.predict_proba(X_check)
+    quantized_accuracy = float(np.mean(compiled.classes_[proba.argmax(axis=1)] == y_check)) if len(y_check) else None
+    return quantized, {
+        'quantize': options['quantize'],
+        'prune_depth': options['prune_depth'],
+        'nodes_before': len(compiled.left),
+        'nodes_after': len(quantized.left),
+        'bytes_before': compiled.nbytes,
+        'bytes_after': quantized.nbytes,
+        'accuracy': quantized_accuracy,
+        'accuracy_delta': quantized_accuracy - accuracy if quantized_accuracy is not None else None,
+        'max_proba_error': float(np.abs(proba - exact_proba).max()) if len(proba) else None
+    }
+
+def _artifact_report(version):
+    # On-disk size of each artifact, and the size and load time of what the
+    # serving registry actually reads
+    metadata = store.metadata(version)
+    serving = store.serving_artifacts(metadata)
+    start = time.perf_counter()
+    store.load(version, mmap_mode=registry.mmap_mode)
+    return {
+        'sizes': metadata['artifacts'],
+        'total_bytes': sum(metadata['artifacts'].values()),
+        'serving_artifacts': serving,
+        'serving_bytes': sum(metadata['artifacts'][name] for name in serving),
+        'load_seconds': time.perf_counter() - start
+    }
+
+def training_model(state):
+    # The sklearn estimator of a version, read from the store when serving
+    # did not load it
+    if state.model is not None:
+        return state.model
+    artifacts, _ = store.load(state.version, names=[TRAINING_PREFIX + 'model'])
+    return artifacts[TRAINING_PREFIX + 'model']
+
+def model_classes(state):
+    # Class labels, from the compiled forest when the model was not loaded
+    return state.model.classes_ if state.model is not None else state.compiled.classes_
+
+def _feature_stats(X):
+    # Count, mean and sum of squared deviations per feature; mergeable
+    mean = X.mean(axis=0)
+    return {'count': len(X), 'mean': mean.tolist(), 'm2': ((X - mean) ** 2).sum(axis=0).tolist()}
+
+def _merge_feature_stats(a, b):
+    # Chan et al. parallel update of mean and variance
+    count = a['count'] + b['count']
+    mean_a, mean_b = np.asarray(a['mean']), np.asarray(b['mean'])
+    delta = mean_b - mean_a
+    mean = mean_a + delta * b['count'] / count
+    m2 = np.asarray(a['m2']) + np.asarray(b['m2']) + delta ** 2 * a['count'] * b['count'] / count
+    return {'count': count, 'mean': mean.tolist(), 'm2': m2.tolist()}
+
+def retrain_reason(training_state, model, X_new, y_new, extra_estimators, policy=None):
+    # Why the new rows cannot simply be added as extra trees, or None if
+    # they can
+    policy = {**DEFAULT_RETRAIN_POLICY, **(policy or {})}
+    if training_state is None:
+        return "no record of a previous full training run"
+    if training_state['estimator'] not in WARM_START_ESTIMATORS:
+        return f"estimator '{training_state['estimator']}' cannot be grown incrementally"
+    reason = _class_reason(model, y_new)
+    if reason is not None:
+        return reason
+    
+    base = training_state['base_samples']
+    if len(X_new) > policy['max_delta_fraction'] * base:
+        return f"delta of {len(X_new)} rows is too large relative to the {base}-row base set"
+    if training_state['incremental_samples'] + len(X_new) > policy['max_incremental_fraction'] * base:
+        return "too many rows have been added since the last full training run"
+    if model.n_estimators + extra_estimators > policy['max_estimators']:
+        return f"forest would exceed {policy['max_estimators']} trees"
+    
+    stats = training_state['feature_stats']
+    std = np.sqrt(np.asarray(stats['m2']) / max(stats['count'], 1))
+    shift = np.abs(X_new.mean(axis=0) - np.asarray(stats['mean'])) / np.where(std > 0, std, 1)
+    # The mean of a small delta is noisy (its standard error is 1/sqrt(n)
+    # training standard deviations), so only the shift beyond that counts
+    significant = shift - policy['mean_shift_z'] / np.sqrt(len(X_new))
+    if significant.max() > policy['max_mean_shift']:
+        feature = int(significant.argmax())
+        return f"feature '{FEATURE_COLUMNS[feature]}' drifted by {shift[feature]:.2f} standard deviations"
+    return None
+
+def _class_reason(model, y):
+    # Warm-started trees are fitted with the labels they are given, so they
+    # must cover exactly the classes of the existing forest
+    classes, known = set(np.unique(y).tolist()), set(model.classes_.tolist())
+    if not classes <= known:
+        return "new rows contain classes the model has not seen"
+    if classes != known:
+        return "new rows do not contain every class the model predicts"
+    return None
+
+def train_incremental_report(new_data, extra_estimators=10, n_jobs=DEFAULT_N_JOBS, policy=None, sources=None):
+    # Grow the current forest with extra trees fitted on the new rows only.
+    # The scaler is kept as is: the existing trees split on values scaled
+    # with it, so refitting it would silently move their thresholds. When the
+    # policy calls for a full retrain, the complete training set is rebuilt
+    # from the parse cache (previous sources plus the new ones) if possible.
+    from sklearn.model_selection import train_test_split
+    
+    started = time.perf_counter()
+    X_new, y_new = _features_and_target(new_data)
+    if len(X_new) == 0:
+        raise ValueError("No new rows to train on.")
+    
+    # Training bookkeeping of the live version (None for legacy artifacts)
+    current = registry.get()
+    training_state = copy.deepcopy(current.metadata.get('training'))
+    current_model = training_model(current)
+    reason = retrain_reason(training_state, current_model, X_new, y_new, extra_estimators, policy)
+    if reason is not None:
+        return _full_retrain_from_sources(training_state, sources, reason, n_jobs)
+    
+    # Hold out part of the delta to score the updated forest
+    stratify = y_new if len(np.unique(y_new)) > 1 and len(y_new) >= 10 else None
+    X_train, X_test, y_train, y_test = train_test_split(X_new, y_new, test_size=0.2, random_state=42, stratify=stratify)
+    if _class_reason(current_model, y_train) is not None:
+        reason = "new rows have too few of some class to hold part of them out for testing"
+        return _full_retrain_from_sources(training_state, sources, reason, n_jobs)
+    
+    scaler = current.scaler
+    X_train_scaled = scaler.transform(X_train)
+    X_test_scaled = scaler.transform(X_test)
+    
+    # Work on a copy so requests keep using the published forest meanwhile
+    start = time.perf_counter()
+    model = copy.deepcopy(current_model)
+    model.set_params(warm_start=True, n_estimators=model.n_estimators + extra_estimators, n_jobs=n_jobs)
+    model.fit(X_train_scaled, y_train)
+    model.set_params(warm_start=False)
+    fit_seconds = time.perf_counter() - start
+    
+    report = {
+        'mode': 'incremental',
+        'accuracy': float(model.score(X_test_scaled, y_test)),
+        'samples': len(X_new),
+        'estimator': training_state['estimator'],
+        'params': training_state['params'],
+        'n_estimators': model.n_estimators,
+        'fit_seconds': fit_seconds
+    }
+    training_state.update({
+        'incremental_samples': training_state['incremental_samples'] + len(X_new),
+        'incremental_runs': training_state['incremental_runs'] + 1,
+        'feature_stats': _merge_feature_stats(training_state['feature_stats'], _feature_stats(X_new)),
+        'sources': training_state['sources'] + list(sources or []),
+        'trained_at': time.time()
+    })
+    # The delta is small next to the base set, so the reference profile of
+    # the last full training run still describes the training data
+    _publish(
+        model, scaler, X_test, X_test_scaled, y_test, report, training_state, current.metadata.get('drift_reference')
+    )
+    record_training(report, time.perf_counter() - started)
+    return report
+
+def _full_retrain_from_sources(training_state, sources, reason, n_jobs):
+    from src.parse import parse_cached
     
+    previous = training_state['sources'] if training_state else []
+    if not previous or not sources:
+        raise ValueError(f"A full retrain is required ({reason}) but the complete training data is not available.")
+    
+    all_sources = previous + list(sources)
+    data = parse_cached(all_sources)
+    report = train_model_report(
+        data,
+        estimator=training_state['estimator'],
+        params=training_state['params'],
+        n_jobs=n_jobs,
+        sources=all_sources,
+        **training_state.get('artifacts', {})
+    )
+    report['retrain_reason'] = reason
+    return report
+
+def export_compiled(model, scaler, X_check, X_check_scaled):
+    # Flatten a fitted forest for the array-based engine. Returns None for
+    # estimators that cannot be compiled, or if the result disagrees with
+    # sklearn, so serving falls back to the sklearn objects
+    compiled = compile_forest(model, scaler)
+    if compiled is not None and len(X_check):
+        # Blank cells and JSON nulls reach serving as NaN, so the check also
+        # covers rows with each feature missing in turn
+        X_check = np.concatenate([X_check, _with_missing(X_check)])
+        X_check_scaled = scaler.transform(X_check)
+        try:
+            expected = model.predict_proba(X_check_scaled)
+        except ValueError:
+            # An estimator that rejects NaN; compare on complete rows only
+            X_check = X_check[~np.isnan(X_check).any(axis=1)]
+            expected = model.predict_proba(scaler.transform(X_check))
+        if not np.allclose(compiled.predict_proba(X_check), expected, rtol=0, atol=1e-9):
+            print("Compiled forest does not match sklearn; serving with sklearn instead")
+            compiled = None
+    return compiled
+
+def _with_missing(X, rows=100):
+    # Copies of the first rows with one feature set to NaN, for every feature
+    X = X[:rows]
+    blocks = []
+    for j in range(X.shape[1]):
+        block = X.copy()
+        block[:, j] = np.nan
+        blocks.append(block)
+    return np.concatenate(blocks)
+
+def train_model(data, **options):
     # Return accuracy
-    accuracy = model.score(X_test_scaled, y_test)
-    return float(accuracy)
+    return train_model_report(data, **options)['accuracy']
+
+# Shared micro-batcher for single-row predictions; None scores each call inline
+_batcher = None
+
+def enable_microbatching(max_batch_size=64, max_wait_ms=2.0):
+    # Score concurrent predict_tenant calls together. Worth it under a
+    # threaded server, where many requests are waiting at once
+    global _batcher
+    from microbatch import MicroBatcher
+
+    # Rows are scored with the state their caller read, so the result is
+    # cached and reported under the version that produced it
+    _batcher = MicroBatcher(_score, max_batch_size, max_wait_ms)
+    return _batcher
+
+def disable_microbatching():
+    global _batcher
+    _batcher = None
+
+def microbatch_stats():
+    return _batcher.stats() if _batcher is not None else None
 
 def predict_tenant(tenant_data):
-    # Check if model exists
-    if not os.path.exists(MODEL_PATH) or not os.path.exists(SCALER_PATH):
-        raise FileNotFoundError("Model or scaler not found. Please train the model first.")
+    # Get the in-memory model and scaler (loaded once, reloaded on change)
+    with stage('model_load'):
+        state = registry.get()
     
-    # Load model and scaler
-    model = joblib.load(MODEL_PATH)
-    scaler = joblib.load(SCALER_PATH)
+    # Prepare input data (null becomes NaN)
+    X = np.array(tenant_data, dtype=np.float64).reshape(1, -1)
     
-    # Prepare input data
-    X = np.array(tenant_data).reshape(1, -1)
-    X_scaled = scaler.transform(X)
+    # Repeat submissions of the same applicant are answered from the cache
+    if prediction_cache.enabled:
+        key = prediction_cache.make_key(X[0])
+        cached = prediction_cache.get(state.version, key)
+        if cached is not None:
+            drift_monitor.observe_row(state, X[0], cached['prediction'])
+            return dict(cached)
     
     # Make prediction
-    prediction = int(model.predict(X_scaled)[0])
-    confidence = float(max(model.predict_proba(X_scaled)[0]))
+    if _batcher is not None:
+        # A malformed row would fail the whole micro-batch, so reject it here
+        if X.shape[1] != len(FEATURE_COLUMNS):
+            raise ValueError(f"Expected {len(FEATURE_COLUMNS)} feature values")
+        with stage('batch_wait'):
+            prediction, confidence = _batcher.predict(X[0], state)
+    else:
+        predictions, confidences = _score(state, X)
+        prediction, confidence = predictions[0], confidences[0]
     
-    return {
-        'prediction': prediction,
-        'confidence': confidence
+    result = {
+        'prediction': int(prediction),
+        'confidence': float(confidence)
     }
+    if prediction_cache.enabled:
+        prediction_cache.put(state.version, key, result)
+    drift_monitor.observe_row(state, X[0], result['prediction'])
+    return dict(result)
+
+def predict_batch(X):
+    # Score an (n_samples, n_features) matrix in a single pass
+    with stage('model_load'):
+        state = registry.get()
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim != 2 or X.shape[1] != len(FEATURE_COLUMNS):
+        raise ValueError(f"Expected a matrix with {len(FEATURE_COLUMNS)} feature columns")
+    if len(X) == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0)
+    predictions, confidences = _score(state, X)
+    drift_monitor.observe_batch(state, X, predictions)
+    return predictions, confidences
+
+def explain_batch(X):
+    # Predictions plus Saabas attributions: for each row, the bias (average
+    # root value) and one contribution per feature, which together add up to
+    # the probability of the predicted class
+    from explain import explainer_for
+
+    with stage('model_load'):
+        state = registry.get()
+    X = np.asarray(X, dtype=np.float64)
+    if X.ndim != 2 or X.shape[1] != len(FEATURE_COLUMNS):
+        raise ValueError(f"Expected a matrix with {len(FEATURE_COLUMNS)} feature columns")
+    explainer = explainer_for(state)
+    if explainer is None:
+        raise ValueError("Explanations are only available for tree ensemble models")
+    
+    with stage('explain'):
+        proba, contributions = explainer.explain(X)
+    best = proba.argmax(axis=1)
+    rows = np.arange(len(best))
+    predictions = model_classes(state)[best].astype(np.int64)
+    return predictions, proba[rows, best], explainer.bias[best], contributions[rows, :, best]
+
+def predict_proba(state, X):
+    # A quantized or pruned forest serves every request, so that all batch
+    # sizes see the same model. Compiled forests pickled before missing
+    # values were routed leave rows with NaN to sklearn
+    if (state.compiled is not None and (len(X) <= COMPILED_MAX_ROWS or not state.compiled.exact)
+            and not (state.compiled.missing_left is None and state.compiled.exact and np.isnan(X).any())):
+        # The scaler is folded into the compiled thresholds
+        with stage('forest_predict'):
+            if len(X) == 1:
+                return state.compiled.predict_proba_row(X[0])[None, :]
+            return state.compiled.predict_proba(X)
+    with stage('scaler_transform'):
+        X_scaled = state.scaler.transform(X)
+    with stage('forest_predict'):
+        return state.model.predict_proba(X_scaled)
+
+def _score(state, X):
+    # One predict_proba call gives both the labels and the confidences;
+    # model.predict would run the whole forest a second time
+    proba = predict_proba(state, X)
+    best = proba.argmax(axis=1)
+    predictions = model_classes(state)[best].astype(np.int64)
+    confidences = proba[np.arange(len(best)), best]
+    return predictions, confidences
 
 if __name__ == "__main__":
     print("Model module loaded successfully")
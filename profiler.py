@@ -0,0 +1,80 @@
+from collections import Counter
+import sys
+import threading
+import time
+
+
+class SamplingProfiler:
+    # Statistical profiler that can be switched on and off in a running
+    # server. A background thread snapshots every other thread's stack at a
+    # fixed interval; results are returned in the folded "frame;frame;frame
+    # count" format understood by flamegraph tools.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._samples_lock = threading.Lock()
+        self._thread = None
+        self._stop = threading.Event()
+        self._samples = Counter()
+        self.interval = None
+        self.started_at = None
+        self.sample_count = 0
+
+    @property
+    def running(self):
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, interval=0.005):
+        with self._lock:
+            if self.running:
+                return False
+            self._samples = Counter()
+            self.sample_count = 0
+            self.interval = interval
+            self.started_at = time.time()
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread is not None:
+            self._stop.set()
+            thread.join()
+        return self.folded()
+
+    def _run(self):
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            stacks = []
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({code.co_filename}:{code.co_firstlineno})")
+                    frame = frame.f_back
+                stacks.append(';'.join(reversed(stack)))
+            with self._samples_lock:
+                self._samples.update(stacks)
+                self.sample_count += 1
+
+    def folded(self, limit=None):
+        with self._samples_lock:
+            samples = self._samples.most_common(limit)
+        return ''.join(f"{stack} {count}\n" for stack, count in samples)
+
+    def status(self):
+        return {
+            'running': self.running,
+            'interval': self.interval,
+            'started_at': self.started_at,
+            'samples': self.sample_count
+        }
+
+
+profiler = SamplingProfiler()
@@ -0,0 +1,69 @@
+import argparse
+import json
+import sys
+
+import numpy as np
+import pandas as pd
+
+from model import FEATURE_COLUMNS, predict_batch
+
+DEFAULT_CHUNKSIZE = 50_000
+FORMATS = ('ndjson', 'csv')
+
+def iter_feature_chunks(source, chunksize=DEFAULT_CHUNKSIZE):
+    # Read the input a fixed number of rows at a time so memory is bounded by
+    # the chunk size rather than the file size
+    reader = pd.read_csv(source, usecols=FEATURE_COLUMNS, chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            yield chunk[FEATURE_COLUMNS].to_numpy(dtype=np.float64)
+
+def format_chunk(predictions, confidences, start, fmt):
+    rows = range(start, start + len(predictions))
+    if fmt == 'csv':
+        lines = [f"{row},{p},{c!r}\n" for row, p, c in zip(rows, predictions.tolist(), confidences.tolist())]
+    else:
+        lines = [
+            json.dumps({'row': row, 'prediction': p, 'confidence': c}) + '\n'
+            for row, p, c in zip(rows, predictions.tolist(), confidences.tolist())
+        ]
+    return ''.join(lines)
+
+def score_stream(source, chunksize=DEFAULT_CHUNKSIZE, fmt='ndjson'):
+    # Generator of output text; each chunk is scored and emitted before the
+    # next one is read
+    return score_chunks(iter_feature_chunks(source, chunksize), fmt)
+
+def score_chunks(chunks, fmt='ndjson'):
+    # score_stream over feature matrices that have already been read
+    if fmt not in FORMATS:
+        raise ValueError(f"Unsupported format '{fmt}', expected one of {', '.join(FORMATS)}")
+
+    if fmt == 'csv':
+        yield 'row,prediction,confidence\n'
+
+    start = 0
+    for X in chunks:
+        predictions, confidences = predict_batch(X)
+        yield format_chunk(predictions, confidences, start, fmt)
+        start += len(X)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Score a CSV of applicants in fixed-size chunks.")
+    parser.add_argument('input', help="CSV file with the feature columns, or '-' for stdin")
+    parser.add_argument('-o', '--output', default='-', help="output file, or '-' for stdout")
+    parser.add_argument('-f', '--format', choices=FORMATS, default='ndjson')
+    parser.add_argument('-c', '--chunksize', type=int, default=DEFAULT_CHUNKSIZE)
+    args = parser.parse_args(argv)
+
+    source = sys.stdin if args.input == '-' else args.input
+    out = sys.stdout if args.output == '-' else open(args.output, 'w', newline='')
+    try:
+        for text in score_stream(source, args.chunksize, args.format):
+            out.write(text)
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+import argparse
+import os
+
+# Threaded server with micro-batching on, for machines without gunicorn.
+# Every request runs on its own thread; concurrent /predict calls wait a
+# few milliseconds and are scored in one vectorized pass.
+#
+#   python serve.py --port 5000 --max-batch-size 64 --max-wait-ms 2
+#   gunicorn -c gunicorn.conf.py app:app   (multi-process equivalent)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the tenant screening API with micro-batched predictions.")
+    parser.add_argument('--host', default=os.environ.get('HOST', '0.0.0.0'))
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', '5000')))
+    parser.add_argument('--max-batch-size', type=int, default=int(os.environ.get('MICROBATCH_MAX_SIZE', '64')),
+                        help="most rows scored together")
+    parser.add_argument('--max-wait-ms', type=float, default=float(os.environ.get('MICROBATCH_WAIT_MS', '2')),
+                        help="longest a request waits for others to join its batch")
+    parser.add_argument('--no-microbatch', action='store_true', help="score every request on its own")
+    args = parser.parse_args(argv)
+
+    # app reads its configuration from the environment at import time
+    os.environ['TENANT_MICROBATCH'] = '0' if args.no_microbatch else '1'
+    os.environ['MICROBATCH_MAX_SIZE'] = str(args.max_batch_size)
+    os.environ['MICROBATCH_WAIT_MS'] = str(args.max_wait_ms)
+    os.environ.setdefault('TENANT_PRELOAD_MODEL', '1')
+
+    from werkzeug.serving import run_simple
+    from app import app
+
+    run_simple(args.host, args.port, app, threaded=True, use_reloader=False, use_debugger=False)
+
+if __name__ == "__main__":
+    main()
@@ -1,45 +1,214 @@
-import pandas as pd
-
-def parse_data(data_path):
-    # Load data
-    df = pd.read_csv(data_path)
-    
-    # Convert ApplicationResult to binary
-    def convert_to_binary(result):
-        if pd.isna(result):
-            return 0
-        return 1 if 'PASSED' in result.upper() else 0
-    
+from concurrent.futures import ProcessPoolExecutor
+import glob
+import hashlib
+import os
+import shutil
+import tempfile
+import uuid
+
+import numpy as np
+
+FEATURE_COLUMNS = [
+    'MonthlyIncome',
+    'FICOScore',
+    'RentToIncomeRatio',
+    'HasCriminalRecord',
+    'HasEvictionHistory',
+    'AssetMonthlyValue'
+]
+LABEL_COLUMN = 'ApplicationResult'
+
+# Only these columns are read from the source CSV. Counts and flags may be
+# blank, so they are read as float32 (NaN-capable) rather than ints
+SOURCE_DTYPES = {
+    'MonthlyIncome': 'float32',
+    'FICOScore': 'float32',
+    'RentToIncomeRatio': 'float32',
+    'CriminalFederalCount': 'float32',
+    'CriminalFelonyCount': 'float32',
+    'CriminalMisdemeanorCount': 'float32',
+    'Failed_Criminal': 'float32',
+    'EvictionCount': 'float32',
+    'Failed_Eviction': 'float32',
+    'AssetMonthlyValue': 'float32',
+    'ApplicationResult': 'str'
+}
+
+# Columns filled with the median of the whole dataset after reading
+MEDIAN_FILL_COLUMNS = ['FICOScore', 'RentToIncomeRatio']
+
+CACHE_DIR = '.parse_cache'
+CACHE_VERSION = 1  # bump when the derived columns change
+
+# Digests already computed, keyed on (path, size, mtime) so an unchanged
+# file is hashed only once per process
+_digests = {}
+
+def file_digest(path, block_size=1 << 20):
+    # SHA-256 of a file's contents, read in blocks
+    st = os.stat(path)
+    key = (os.path.realpath(path), st.st_size, st.st_mtime_ns)
+    if key in _digests:
+        return _digests[key]
+
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    _digests[key] = digest.hexdigest()
+    return _digests[key]
+
+def read_columns(data_path):
+    import pandas as pd
+
+    # Load only the needed columns with explicit dtypes
+    df = pd.read_csv(data_path, usecols=list(SOURCE_DTYPES), dtype=SOURCE_DTYPES)
+
     # Create binary features
-    df['HasCriminalRecord'] = (
-        (df['CriminalFederalCount'] > 0) | 
-        (df['CriminalFelonyCount'] > 0) | 
-        (df['CriminalMisdemeanorCount'] > 0) | 
+    has_criminal_record = (
+        (df['CriminalFederalCount'] > 0) |
+        (df['CriminalFelonyCount'] > 0) |
+        (df['CriminalMisdemeanorCount'] > 0) |
         (df['Failed_Criminal'] == 1)
-    ).astype(int)
-    
-    df['HasEvictionHistory'] = (
-        (df['EvictionCount'] > 0) | 
+    )
+    has_eviction_history = (
+        (df['EvictionCount'] > 0) |
         (df['Failed_Eviction'] == 1)
-    ).astype(int)
-    
-    # Fill NaN values with 0 or median
-    df['FICOScore'] = df['FICOScore'].fillna(df['FICOScore'].median())
-    df['AssetMonthlyValue'] = df['AssetMonthlyValue'].fillna(0)
-    df['MonthlyIncome'] = df['MonthlyIncome'].fillna(0)
-    df['RentToIncomeRatio'] = df['RentToIncomeRatio'].fillna(df['RentToIncomeRatio'].median())
-    
-    df['ApplicationResult'] = df['ApplicationResult'].apply(convert_to_binary)
-    
-    # Extract relevant columns
-    values = df[[
-        'MonthlyIncome',
-        'FICOScore', 
-        'RentToIncomeRatio',
-        'HasCriminalRecord',
-        'HasEvictionHistory',
-        'AssetMonthlyValue',
-        'ApplicationResult'
-    ]].values.tolist()
-    
-    return values
\ No newline at end of file
+    )
+
+    # Convert ApplicationResult to binary (missing results count as failed)
+    passed = df[LABEL_COLUMN].str.contains('PASSED', case=False, regex=False, na=False)
+
+    # Median fills are left for fill_missing so they can be computed over
+    # more than one file
+    return {
+        'MonthlyIncome': df['MonthlyIncome'].fillna(0).to_numpy(),
+        'FICOScore': df['FICOScore'].to_numpy(),
+        'RentToIncomeRatio': df['RentToIncomeRatio'].to_numpy(),
+        'HasCriminalRecord': has_criminal_record.to_numpy(dtype=np.int8),
+        'HasEvictionHistory': has_eviction_history.to_numpy(dtype=np.int8),
+        'AssetMonthlyValue': df['AssetMonthlyValue'].fillna(0).to_numpy(),
+        LABEL_COLUMN: passed.to_numpy(dtype=np.int8)
+    }
+
+def fill_missing(columns):
+    # Fill NaN values with the column median, in place
+    for name in MEDIAN_FILL_COLUMNS:
+        values = columns[name]
+        missing = np.isnan(values)
+        if missing.any() and not missing.all():
+            if not values.flags.writeable:
+                values = columns[name] = values.copy()
+            values[missing] = np.median(values[~missing])
+    return columns
+
+def to_frame(columns):
+    import pandas as pd
+
+    return pd.DataFrame({name: columns[name] for name in FEATURE_COLUMNS + [LABEL_COLUMN]}, copy=False)
+
+def _cache_path(data_path, cache_dir):
+    return os.path.join(cache_dir, f"{file_digest(data_path)}-v{CACHE_VERSION}")
+
+def load_cached_columns(path, mmap_mode=None):
+    return {
+        name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode=mmap_mode)
+        for name in FEATURE_COLUMNS + [LABEL_COLUMN]
+    }
+
+def save_cached_columns(columns, path):
+    # Write every column into a scratch directory, then rename it into place
+    # so a concurrent reader never sees a partial cache entry
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    os.makedirs(tmp_path)
+    try:
+        for name, values in columns.items():
+            np.save(os.path.join(tmp_path, f"{name}.npy"), values)
+        os.replace(tmp_path, path)
+    except OSError:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        if not os.path.isdir(path):
+            raise
+
+def read_columns_cached(data_path, cache_dir=CACHE_DIR):
+    # Unfilled columns for one file, from the columnar cache when available
+    if cache_dir is None:
+        return read_columns(data_path)
+
+    path = _cache_path(data_path, cache_dir)
+    if os.path.isdir(path):
+        return load_cached_columns(path)
+
+    columns = read_columns(data_path)
+    os.makedirs(cache_dir, exist_ok=True)
+    save_cached_columns(columns, path)
+    return columns
+
+def cache_entry(data_path, cache_dir=CACHE_DIR):
+    # Path of the cache entry for a file, parsing it first if needed
+    path = _cache_path(data_path, cache_dir)
+    if not os.path.isdir(path):
+        os.makedirs(cache_dir, exist_ok=True)
+        save_cached_columns(read_columns(data_path), path)
+    return path
+
+def cache_entries(paths, cache_dir=CACHE_DIR, max_workers=None):
+    # Cache entries for several files, parsing the uncached ones in parallel
+    paths = list(paths)
+    if len(paths) == 1 or max_workers == 1:
+        return [cache_entry(path, cache_dir) for path in paths]
+    with ProcessPoolExecutor(max_workers=min(len(paths), max_workers or os.cpu_count() or 1)) as pool:
+        return list(pool.map(cache_entry, paths, [cache_dir] * len(paths)))
+
+def combine_entries(entries):
+    # Copy the memory-mapped shards straight into one preallocated array per
+    # column, so peak memory is about the size of the combined columns
+    shards = [load_cached_columns(entry, mmap_mode='r') for entry in entries]
+    total = sum(len(shard[LABEL_COLUMN]) for shard in shards)
+    columns = {}
+    for name in FEATURE_COLUMNS + [LABEL_COLUMN]:
+        dtype = np.result_type(*[shard[name].dtype for shard in shards])
+        values = columns[name] = np.empty(total, dtype=dtype)
+        offset = 0
+        for shard in shards:
+            values[offset:offset + len(shard[name])] = shard[name]
+            offset += len(shard[name])
+    return columns
+
+def parse_cached(entries):
+    # Rebuild one training set from several cache entries; the median fills
+    # are computed over all of them together
+    if any(not os.path.isdir(entry) for entry in entries):
+        raise FileNotFoundError("Parsed data for an earlier training file is no longer cached.")
+    return to_frame(fill_missing(combine_entries(entries)))
+
+def resolve_paths(source):
+    # CSV files named by a path, a directory, a glob pattern or a list of
+    # those, in a stable (sorted) order
+    if isinstance(source, (list, tuple)):
+        return [path for item in source for path in resolve_paths(item)]
+    if os.path.isdir(source):
+        paths = sorted(glob.glob(os.path.join(source, '*.csv')))
+    elif glob.has_magic(source):
+        paths = sorted(glob.glob(source))
+    else:
+        paths = [source]
+    if not paths:
+        raise FileNotFoundError(f"No CSV files match '{source}'")
+    return paths
+
+def parse_many(source, cache_dir=CACHE_DIR, max_workers=None):
+    # parse_data for a directory, glob or list of monthly exports: each file
+    # is parsed in its own process, then the shards are combined and filled
+    # with medians of the whole dataset
+    paths = resolve_paths(source)
+    if cache_dir is None:
+        # The shards still pass through disk, just not into a lasting cache
+        with tempfile.TemporaryDirectory() as tmp:
+            return parse_cached(cache_entries(paths, tmp, max_workers))
+    return parse_cached(cache_entries(paths, cache_dir, max_workers))
+
+def parse_data(data_path, cache_dir=CACHE_DIR):
+    # Returns a DataFrame with the feature columns followed by ApplicationResult
+    columns = read_columns_cached(data_path, cache_dir)
+    return to_frame(fill_missing(columns))
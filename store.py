@@ -0,0 +1,160 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+
+import joblib
+
+STORE_DIR = 'model_store'
+
+# Artifacts named with this prefix are only needed to train on top of a
+# version; load() skips them unless they are asked for by name
+TRAINING_PREFIX = 'training_'
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class ModelStore:
+    # Versioned, content-addressed artifact store.
+    #
+    #   model_store/versions/<version>/<name>.joblib  immutable artifact sets
+    #   model_store/versions/<version>/metadata.json
+    #   model_store/CURRENT                            name of the live version
+    #
+    # A version directory is written in full under tmp/ and renamed into
+    # place, and CURRENT is replaced atomically, so readers only ever see a
+    # complete model/scaler pair. Rolling back is rewriting CURRENT.
+    # Artifacts named training_* are kept with the version but not loaded
+    # for serving.
+
+    def __init__(self, root=STORE_DIR):
+        self.root = root
+        self.versions_dir = os.path.join(root, 'versions')
+        self.pointer_path = os.path.join(root, 'CURRENT')
+
+    def path(self, version):
+        return os.path.join(self.versions_dir, version)
+
+    def current(self):
+        try:
+            with open(self.pointer_path) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, artifacts, metadata=None, activate=True, compress=0):
+        # Write the artifacts (name -> object) and metadata as a new version
+        # named after a hash of the artifact bytes. compress is a joblib
+        # compression level; compressed artifacts are smaller on disk but are
+        # always read fully into memory, never memory-mapped
+        tmp_dir = os.path.join(self.root, 'tmp', uuid.uuid4().hex)
+        os.makedirs(tmp_dir)
+        try:
+            digest = hashlib.sha256()
+            sizes = {}
+            for name in sorted(artifacts):
+                path = os.path.join(tmp_dir, f"{name}.joblib")
+                joblib.dump(artifacts[name], path, compress=compress)
+                with open(path, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        digest.update(block)
+                    os.fsync(f.fileno())
+                digest.update(name.encode())
+                sizes[name] = os.path.getsize(path)
+            version = digest.hexdigest()[:16]
+
+            metadata = dict(metadata or {})
+            metadata.update({
+                'version': version,
+                'created_at': time.time(),
+                'parent': self.current(),
+                'compress': compress,
+                'artifacts': sizes
+            })
+            with open(os.path.join(tmp_dir, 'metadata.json'), 'w') as f:
+                json.dump(metadata, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+
+            os.makedirs(self.versions_dir, exist_ok=True)
+            if os.path.isdir(self.path(version)):
+                # Identical artifacts were published before; reuse them
+                shutil.rmtree(tmp_dir)
+            else:
+                os.rename(tmp_dir, self.path(version))
+                _fsync_dir(self.versions_dir)
+        except BaseException:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            raise
+
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version):
+        # Point CURRENT at an existing version (publish or rollback)
+        if not os.path.isfile(os.path.join(self.path(version), 'metadata.json')):
+            raise KeyError(f"Unknown model version '{version}'")
+        tmp_path = f"{self.pointer_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(version + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.pointer_path)
+        _fsync_dir(self.root)
+        return version
+
+    def metadata(self, version):
+        try:
+            with open(os.path.join(self.path(version), 'metadata.json')) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            raise KeyError(f"Unknown model version '{version}'") from None
+
+    def serving_artifacts(self, metadata):
+        # Names of the artifacts load() reads by default
+        return [name for name in metadata['artifacts'] if not name.startswith(TRAINING_PREFIX)]
+
+    def load(self, version, mmap_mode=None, names=None):
+        # The serving artifacts of a version (or the given names) plus its
+        # metadata
+        path = self.path(version)
+        metadata = self.metadata(version)
+        if metadata.get('compress'):
+            mmap_mode = None  # joblib would only warn and read them anyway
+        if names is None:
+            names = self.serving_artifacts(metadata)
+        artifacts = {
+            name: joblib.load(os.path.join(path, f"{name}.joblib"), mmap_mode=mmap_mode)
+            for name in names
+        }
+        return artifacts, metadata
+
+    def list_versions(self):
+        if not os.path.isdir(self.versions_dir):
+            return []
+        versions = []
+        for version in os.listdir(self.versions_dir):
+            try:
+                versions.append(self.metadata(version))
+            except KeyError:
+                continue
+        return sorted(versions, key=lambda metadata: metadata['created_at'], reverse=True)
+
+    def prune(self, keep=10):
+        # Delete all but the newest `keep` versions, never the current one
+        current = self.current()
+        removed = []
+        for metadata in self.list_versions()[keep:]:
+            if metadata['version'] != current:
+                shutil.rmtree(self.path(metadata['version']), ignore_errors=True)
+                removed.append(metadata['version'])
+        return removed
@@ -0,0 +1,80 @@
+import numpy as np
+import pytest
+from sklearn.ensemble import ExtraTreesClassifier, RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+from explain import ForestExplainer
+from forest_engine import compile_forest, quantize_forest
+
+
+def _data(n_rows=2000, seed=0):
+    # Features on the scales of the real ones, with NaN in some cells
+    rng = np.random.default_rng(seed)
+    X = np.column_stack([
+        rng.normal(5000, 1500, n_rows),
+        rng.integers(300, 851, n_rows),
+        rng.uniform(0.1, 0.8, n_rows),
+        rng.integers(0, 2, n_rows),
+        rng.integers(0, 2, n_rows),
+        rng.normal(800, 300, n_rows)
+    ]).astype(np.float64)
+    y = ((X[:, 1] - 600) / 100 + (X[:, 0] - 5000) / 2000 - X[:, 3] + rng.normal(0, 0.5, n_rows) > 0).astype(np.int64)
+    return X, y
+
+
+def _fit(estimator, X, y):
+    scaler = StandardScaler().fit(X)
+    model = estimator(n_estimators=20, random_state=0).fit(scaler.transform(X), y)
+    return model, scaler, compile_forest(model, scaler)
+
+
+def _with_nan(X, seed=1):
+    X = X.copy()
+    rng = np.random.default_rng(seed)
+    X[rng.random(X.shape) < 0.2] = np.nan
+    X[:50, 1] = np.nan  # a whole feature missing
+    return X
+
+
+@pytest.mark.parametrize('estimator', [RandomForestClassifier, ExtraTreesClassifier])
+@pytest.mark.parametrize('missing_in_training', [False, True])
+def test_compiled_matches_sklearn(estimator, missing_in_training):
+    X, y = _data()
+    X_train = _with_nan(X, seed=2) if missing_in_training else X
+    model, scaler, compiled = _fit(estimator, X_train, y)
+
+    for X_test in (X, _with_nan(X)):
+        expected = model.predict_proba(scaler.transform(X_test))
+        np.testing.assert_allclose(compiled.predict_proba(X_test), expected, rtol=0, atol=1e-9)
+        for row in range(0, len(X_test), 97):
+            np.testing.assert_allclose(compiled.predict_proba_row(X_test[row]), expected[row], rtol=0, atol=1e-9)
+
+
+def test_compiled_matches_sklearn_on_split_points():
+    # Values exactly on a threshold must go the same way as in sklearn
+    X, y = _data()
+    model = RandomForestClassifier(n_estimators=20, random_state=0).fit(X, y)
+    compiled = compile_forest(model)
+    tree = model.estimators_[0].tree_
+    split = tree.children_left != -1
+    X_edge = np.repeat(X[:1], split.sum(), axis=0)
+    X_edge[np.arange(len(X_edge)), tree.feature[split]] = tree.threshold[split]
+    np.testing.assert_allclose(compiled.predict_proba(X_edge), model.predict_proba(X_edge), rtol=0, atol=1e-9)
+
+
+def test_quantized_forest_keeps_missing_value_routing():
+    X, y = _data()
+    _, _, compiled = _fit(RandomForestClassifier, X, y)
+    X_test = _with_nan(X)
+    np.testing.assert_allclose(quantize_forest(compiled).predict_proba(X_test), compiled.predict_proba(X_test),
+                               rtol=0, atol=1e-12)
+
+
+def test_explanations_add_up_to_predict_proba_with_missing_values():
+    X, y = _data()
+    _, _, compiled = _fit(RandomForestClassifier, X, y)
+    X_test = _with_nan(X[:300])
+    explainer = ForestExplainer(compiled)
+    proba, contributions = explainer.explain(X_test)
+    np.testing.assert_allclose(proba, compiled.predict_proba(X_test), rtol=0, atol=1e-12)
+    np.testing.assert_allclose(explainer.bias + contributions.sum(axis=1), proba, rtol=0, atol=1e-9)